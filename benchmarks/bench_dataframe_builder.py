@@ -0,0 +1,72 @@
+"""Compare the per-row DataFrame._append builder with the columnar builder.
+
+Usage:
+    python -m benchmarks.bench_dataframe_builder --artists 100 500 1000
+"""
+from src.data_exporter import ConsumeAPI, COLUMNS
+import argparse
+import pandas as pd
+import time
+
+def synthetic_artist(index: int) -> tuple[str, dict, list]:
+    artist_info = {"name": f"Artist {index}", "followers": {"total": index * 100}, "popularity": index % 100}
+    songs_info = [
+        {
+            "name": f"Song {index}-{track}",
+            "popularity": track * 10,
+            "album": {"release_date": "2023-01-01", "name": f"Album {index}", "total_tracks": 10}
+        }
+        for track in range(10)
+    ]
+
+    return f"ID{index}", artist_info, songs_info
+
+def append_builder(artists: list) -> pd.DataFrame:
+    df = pd.DataFrame(columns=COLUMNS)
+    query_date = pd.Timestamp.now().strftime("%Y-%m-%d")
+
+    for artist_id, artist_info, songs_info in artists:
+        for song in songs_info:
+            df = df._append({
+                "id_artist": artist_id,
+                "query_date": query_date,
+                "artist_name": artist_info["name"],
+                "followers": artist_info["followers"]["total"],
+                "artist_popularity": artist_info["popularity"],
+                "name_song": song["name"],
+                "song_popularity": song["popularity"],
+                "release_date": song["album"]["release_date"],
+                "album_name": song["album"]["name"],
+                "total_tracks": song["album"]["total_tracks"]
+            }, ignore_index=True)
+
+    return df
+
+def columnar_builder(artists: list) -> pd.DataFrame:
+    consumeapi = ConsumeAPI()
+
+    for artist_id, artist_info, songs_info in artists:
+        consumeapi.dataframe_builder(artist_id, artist_info, songs_info)
+
+    return consumeapi.build_dataframe()
+
+def measure(builder, artists: list) -> float:
+    start_time = time.perf_counter()
+    builder(artists)
+
+    return time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artists", nargs="+", type=int, default=[100, 500, 1000])
+    args = parser.parse_args()
+
+    print(f"{'artists':>8} {'rows':>8} {'_append (s)':>12} {'columnar (s)':>13} {'speedup':>8}")
+    for total in args.artists:
+        artists = [synthetic_artist(index) for index in range(total)]
+        append_time = measure(append_builder, artists)
+        columnar_time = measure(columnar_builder, artists)
+        print(f"{total:>8} {total * 10:>8} {append_time:>12.3f} {columnar_time:>13.3f} {append_time / columnar_time:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
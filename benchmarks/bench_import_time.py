@@ -0,0 +1,41 @@
+"""Measure the cold-start time of the query path against the export path.
+
+Each case runs in a fresh interpreter, so module caches do not hide the cost.
+
+Usage:
+    python -m benchmarks.bench_import_time --runs 20
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+CASES = {
+    "interpreter": "pass",
+    "query path (src.data_provider)": "import src.data_provider",
+    "export path (src.data_exporter)": "import src.data_exporter",
+}
+
+def measure(code: str, runs: int) -> list[float]:
+    timings = []
+
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        timings.append(time.perf_counter() - start_time)
+
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'case':<34} {'median (ms)':>12} {'min (ms)':>10}")
+    for name, code in CASES.items():
+        timings = measure(code, args.runs)
+        print(f"{name:<34} {statistics.median(timings) * 1000:>12.1f} {min(timings) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Local stand-in for the Spotify API endpoints used by ConsumeAPI.
+
+Serves the token, search, artists (single and batched) and top-tracks
+endpoints with deterministic payloads, an optional latency per request, a
+429 Too Many Requests answer every throttle_every requests and a
+configurable number of tracks and padding per track. Responses carry an ETag
+(304 Not Modified on If-None-Match) and Cache-Control max-age=max_age.
+
+Usage:
+    python -m benchmarks.fake_spotify --port 8080 --latency 0.05 --throttle_every 100
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+def artist_id(artist_name: str) -> str:
+    return hashlib.md5(artist_name.encode("utf-8")).hexdigest()[:22]
+
+def artist_payload(artist_id: str) -> dict:
+    seed = int(artist_id[:8], 16)
+
+    return {
+        "id": artist_id,
+        "name": f"Artist {artist_id[:6]}",
+        "followers": {"total": seed % 10000000},
+        "popularity": seed % 100
+    }
+
+def tracks_payload(artist_id: str, tracks: int, padding: int) -> list[dict]:
+    return [
+        {
+            "name": f"Song {artist_id[:6]}-{track}",
+            "popularity": (int(artist_id[:8], 16) + track) % 100,
+            "album": {
+                "release_date": "2023-01-01",
+                "name": f"Album {artist_id[:6]}" + "x" * padding,
+                "total_tracks": tracks
+            }
+        }
+        for track in range(tracks)
+    ]
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without TCP_NODELAY every
+    # keep-alive response waits for the client's delayed ACK (~40 ms).
+    disable_nagle_algorithm = True
+
+    def reply(self, payload: dict, status=200, headers=None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        with self.server.lock:
+            self.server.connections.add(self.client_address)
+
+        if status == 200 and self.command == "GET":
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            headers = {**(headers or {}), "ETag": etag, "Cache-Control": f"max-age={self.server.max_age}"}
+            if self.headers.get("If-None-Match") == etag:
+                status, body = 304, b""
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.reply({"access_token": "BENCH", "token_type": "Bearer", "expires_in": 3600})
+
+    def do_GET(self):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+
+        if server.throttled():
+            self.reply({"error": {"status": 429}}, 429, {"Retry-After": str(server.retry_after)})
+            return
+
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+
+        if parts == ["v1", "search"]:
+            self.reply({"artists": {"items": [{"id": artist_id(params["q"][0])}]}})
+        elif parts == ["v1", "artists"]:
+            self.reply({"artists": [artist_payload(item) for item in params["ids"][0].split(",")]})
+        elif len(parts) == 4 and parts[3] == "top-tracks":
+            self.reply({"tracks": tracks_payload(parts[2], server.tracks, server.padding)})
+        elif len(parts) == 3 and parts[1] == "artists":
+            self.reply(artist_payload(parts[2]))
+        else:
+            self.reply({"error": {"status": 404}}, 404)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSpotifyServer(ThreadingHTTPServer):
+    """Fake Spotify API served from a background thread.
+
+    Methods:
+        start: Serve the requests from a daemon thread.
+        stop: Shut the server down.
+        throttled: Count a request and tell if it must be answered with 429.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, throttle_every=0, retry_after=0,
+                 tracks=10, padding=0, max_age=0):
+        super().__init__((host, port), FakeSpotifyHandler)
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.tracks = tracks
+        self.padding = padding
+        self.max_age = max_age
+        self.requests = 0
+        self.throttled_requests = 0
+        # Client (host, port) of every connection that was answered, to check keep-alive.
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.api_url = f"http://{host}:{self.server_port}/v1"
+        self.auth_url = f"http://{host}:{self.server_port}/api/token"
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def throttled(self) -> bool:
+        with self.lock:
+            self.requests += 1
+            throttled = bool(self.throttle_every) and self.requests % self.throttle_every == 0
+            self.throttled_requests += throttled
+
+        return throttled
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API request")
+    parser.add_argument("--throttle_every", type=int, default=0, help="Answer 429 to every Nth API request")
+    parser.add_argument("--retry_after", type=int, default=0, help="Retry-After seconds of the 429 answers")
+    parser.add_argument("--tracks", type=int, default=10, help="Top tracks per artist")
+    parser.add_argument("--padding", type=int, default=0, help="Extra characters per track payload")
+    parser.add_argument("--max_age", type=int, default=0, help="Cache-Control max-age of the responses")
+    args = parser.parse_args()
+
+    server = FakeSpotifyServer(port=args.port, latency=args.latency, throttle_every=args.throttle_every,
+                               retry_after=args.retry_after, tracks=args.tracks, padding=args.padding,
+                               max_age=args.max_age)
+    print(f"Serving {server.api_url} (token: {server.auth_url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Generate a synthetic artists_data history database.
+
+Every artist gets one snapshot of its top tracks per day, with followers and
+popularity drifting from day to day. The derived tables (latest_snapshot,
+artist_daily_stats, artist_ids) are refreshed at the end with the same
+statements as real exports (latest snapshot per artist and market).
+Rows = artists * days * tracks, e.g. 1000 artists * 365 days * 10 tracks = 3.65M.
+
+Usage:
+    python -m benchmarks.generate_history --artists 1000 --days 365 --out benchmarks/data
+"""
+from src.data_provider import ConnectToSQLite, REFRESH_DAILY_STATS_STATEMENT, REFRESH_LATEST_SNAPSHOT_STATEMENTS
+import argparse
+import datetime
+import itertools
+import random
+import time
+
+def artist_name(index: int) -> str:
+    return f"Synthetic Artist {index}"
+
+def iter_rows(artists: int, days: int, tracks: int, start_date: str, seed: int):
+    rng = random.Random(seed)
+    first_day = datetime.date.fromisoformat(start_date)
+    bases = [(rng.randint(1000, 10000000), rng.uniform(-0.001, 0.005), rng.randint(20, 90)) for _ in range(artists)]
+
+    for day in range(days):
+        query_date = (first_day + datetime.timedelta(days=day)).isoformat()
+
+        for index, (followers, growth, popularity) in enumerate(bases):
+            artist_followers = int(followers * (1 + growth) ** day)
+            artist_popularity = min(100, max(0, popularity + rng.randint(-2, 2)))
+
+            for track in range(tracks):
+                yield (
+                    f"SYN{index:019d}",
+                    query_date,
+                    artist_name(index),
+                    artist_followers,
+                    artist_popularity,
+                    f"Song {index}-{(track + day // 30) % (tracks * 2)}",
+                    min(100, max(0, artist_popularity - track + rng.randint(-3, 3))),
+                    "2023-01-01",
+                    f"Album {index}",
+                    tracks,
+                    "BR"
+                )
+
+def generate_history(base_path: str, artists=1000, days=30, tracks=10, start_date="2023-01-01",
+                     seed=0, batch_size=100000) -> str:
+    database = ConnectToSQLite(base_path=base_path)
+    conn = database.connect_database()
+    conn.execute("PRAGMA synchronous = OFF")
+    rows = iter_rows(artists, days, tracks, start_date, seed)
+
+    with conn:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+
+            database.insert_rows(conn, batch)
+
+    # The derived tables are refreshed with the statements of the exports.
+    with conn:
+        latest_keys = conn.execute("""
+            SELECT artists.id_artist, track_snapshots.market, MAX(track_snapshots.query_date)
+            FROM track_snapshots
+            JOIN tracks ON tracks.track_key = track_snapshots.track_key
+            JOIN artists ON artists.artist_key = tracks.artist_key
+            GROUP BY artists.artist_key, track_snapshots.market
+        """).fetchall()
+        for statement in REFRESH_LATEST_SNAPSHOT_STATEMENTS:
+            conn.executemany(statement, latest_keys)
+        conn.executemany(REFRESH_DAILY_STATS_STATEMENT, conn.execute("""
+            SELECT artists.id_artist, artist_snapshots.query_date
+            FROM artist_snapshots JOIN artists ON artists.artist_key = artist_snapshots.artist_key
+        """).fetchall())
+        conn.execute("""
+            INSERT OR IGNORE INTO artist_ids (search_name, id_artist, resolved_at)
+            SELECT normalize_name(artist_name), id_artist, CAST(strftime('%s', 'now') AS REAL)
+            FROM latest_snapshot
+        """)
+        conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+
+    conn.execute("PRAGMA optimize")
+    path = database.database_path()
+    database.close_database()
+
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artists", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--start_date", type=str, default="2023-01-01")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default="benchmarks/data", help="Base path of the generated database")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    path = generate_history(args.out, args.artists, args.days, args.tracks, args.start_date, args.seed)
+    rows = args.artists * args.days * args.tracks
+    print(f"{rows} rows written to {path} in {time.perf_counter() - start_time:.1f} seconds.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""Repeatable benchmarks of the export and lookup paths, written to JSON.
+
+Everything runs against a temporary directory: the export talks to the local
+fake Spotify server (benchmarks.fake_spotify) and the database benchmarks use
+a synthetic history (benchmarks.generate_history).
+
+    export: artists and rows per second of a full export through ConsumeAPI.
+    dedup: cost of inserting a new day against re-inserting it as duplicates.
+    csv_export: time to write the whole history to CSV files.
+    history: size of the synthetic history database and time to generate it.
+    lookup: DataProvider latency percentiles (single, batch, trends, cached).
+
+Usage:
+    python -m benchmarks.run_benchmarks --artists 1000 --days 90 --out results.json
+    python -m benchmarks.run_benchmarks --only lookup --baseline results.json
+"""
+from benchmarks.fake_spotify import FakeSpotifyServer
+from benchmarks.generate_history import artist_name, generate_history
+from src.data_exporter import ConsumeAPI, DataExporter, RateLimiter, TokenManager, COLUMNS, DTYPES
+from src.data_provider import ConnectToSQLite, DataProvider, QueryCache
+import argparse
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+import pandas as pd
+
+BENCHMARKS = ["export", "dedup", "csv_export", "lookup"]
+
+def timed(function, *args) -> float:
+    start_time = time.perf_counter()
+    function(*args)
+
+    return time.perf_counter() - start_time
+
+def percentiles(timings: list[float]) -> dict:
+    timings = sorted(timings)
+
+    return {
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[math.ceil(len(timings) * 0.95) - 1] * 1000, 3),
+        "p99_ms": round(timings[math.ceil(len(timings) * 0.99) - 1] * 1000, 3),
+        "max_ms": round(timings[-1] * 1000, 3)
+    }
+
+def bench_export(args, tmpdir: str) -> dict:
+    os.environ.setdefault("CLIENT_ID", "bench")
+    os.environ.setdefault("CLIENT_SECRET", "bench")
+    names_path = os.path.join(tmpdir, "names.txt")
+    with open(names_path, "w", encoding="utf-8") as outfile:
+        outfile.writelines(f"Bench Artist {index}\n" for index in range(args.export_artists))
+
+    with FakeSpotifyServer(latency=args.latency, throttle_every=args.throttle_every, tracks=args.tracks,
+                           padding=args.padding) as server:
+        source = ConsumeAPI(api_url=server.api_url, auth_url=server.auth_url, max_workers=args.workers,
+                            rate_limiter=RateLimiter(rate=args.rate_limit))
+        source.token_manager = TokenManager(source.request_token)
+        with ConnectToSQLite(base_path=os.path.join(tmpdir, "export")) as database:
+            exporter = DataExporter(source=source, conn=database, names_path=names_path)
+            start_time = time.perf_counter()
+            num_inserted, _, failed = exporter.export_data()
+            seconds = time.perf_counter() - start_time
+
+    return {
+        "artists": args.export_artists,
+        "rows": num_inserted,
+        "failed": len(failed),
+        "requests": server.requests,
+        "throttled_requests": server.throttled_requests,
+        "seconds": round(seconds, 4),
+        "artists_per_s": round(args.export_artists / seconds, 1),
+        "rows_per_s": round(num_inserted / seconds, 1)
+    }
+
+def bench_dedup(args, database: ConnectToSQLite) -> dict:
+    conn = database.connect_database()
+    query_date = conn.execute("SELECT date(MAX(query_date), '+1 day') FROM artists_data").fetchone()[0]
+    df = pd.DataFrame(
+        [
+            (f"SYN{index:019d}", query_date, artist_name(index), 1000, 50, f"New Song {index}-{track}", 50,
+             "2023-01-01", f"Album {index}", args.tracks, "BR")
+            for index in range(args.artists)
+            for track in range(args.tracks)
+        ],
+        columns=COLUMNS
+    ).astype(DTYPES)
+    exporter = DataExporter(source=object(), conn=database, skip_duplicates=True)
+    insert_seconds = timed(exporter.insert_data_db, conn, df)
+    duplicate_seconds = timed(exporter.insert_data_db, conn, df)
+
+    return {
+        "rows": len(df),
+        "insert_s": round(insert_seconds, 4),
+        "duplicates_s": round(duplicate_seconds, 4),
+        "insert_rows_per_s": round(len(df) / insert_seconds, 1),
+        "duplicates_rows_per_s": round(len(df) / duplicate_seconds, 1)
+    }
+
+def bench_csv_export(args, database: ConnectToSQLite) -> dict:
+    conn = database.connect_database()
+    with conn:
+        conn.execute("DELETE FROM export_watermark")
+    rows = conn.execute("SELECT COUNT(*) FROM artists_data").fetchone()[0]
+    seconds = timed(DataExporter(source=object(), conn=database).export_sql_to_csv, conn)
+
+    return {"rows": rows, "seconds": round(seconds, 4), "rows_per_s": round(rows / seconds, 1)}
+
+def bench_lookup(args, database: ConnectToSQLite) -> dict:
+    rng = random.Random(args.seed)
+    artists = [artist_name(rng.randrange(args.artists)) for _ in range(args.lookups)]
+    provider = DataProvider(source=object(), conn=database)
+    cached = DataProvider(source=object(), conn=database, cache=QueryCache(maxsize=3 * args.lookups))
+    results = {}
+
+    for name, lookup in (
+        ("getRecentDataByArtist", provider.getRecentDataByArtist),
+        ("getRecentTopTracksDataByArtist", provider.getRecentTopTracksDataByArtist),
+        ("getArtistTrends", provider.getArtistTrends),
+        ("getTrackTrends", provider.getTrackTrends),
+        ("getRecentDataByArtist_folded", lambda artist: provider.getRecentDataByArtist(artist.upper())),
+        ("searchArtists_prefix", lambda artist: provider.searchArtists(artist[:len(artist) // 2])),
+        ("searchArtists_fuzzy", lambda artist: provider.searchArtists("x" + artist[1:]))
+    ):
+        results[name] = percentiles([timed(lookup, artist) for artist in artists])
+
+    batches = [artists[i:i + 100] for i in range(0, len(artists), 100)]
+    results["getRecentDataByArtists_100"] = percentiles([timed(provider.getRecentDataByArtists, batch) for batch in batches])
+
+    for name, lookup in (
+        ("getRecentDataByArtist_cached", cached.getRecentDataByArtist),
+        ("getArtistTrends_cached", cached.getArtistTrends),
+        ("searchArtists_fuzzy_cached", lambda artist: cached.searchArtists("x" + artist[1:]))
+    ):
+        for artist in artists:
+            lookup(artist)
+        results[name] = percentiles([timed(lookup, artist) for artist in artists])
+
+    return results
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("out", "baseline")}
+    }
+
+def compare(results: dict, baseline: dict, path=()) -> None:
+    for key, value in results.items():
+        old = baseline.get(key) if isinstance(baseline, dict) else None
+
+        if isinstance(value, dict):
+            compare(value, old or {}, path + (key,))
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old and key.endswith(("_s", "_ms", "seconds", "_bytes")):
+            print(f"{'.'.join(path + (key,)):<60} {old:>12.3f} {value:>12.3f} {value / old:>8.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--artists", type=int, default=1000, help="Artists of the synthetic history")
+    parser.add_argument("--days", type=int, default=30, help="Days of the synthetic history")
+    parser.add_argument("--tracks", type=int, default=10, help="Top tracks per artist and day")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--lookups", type=int, default=500, help="Lookups per DataProvider method")
+    parser.add_argument("--export_artists", type=int, default=200, help="Artists exported from the fake server")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate_limit", type=float, default=1000, help="Requests per second allowed by the rate limiter")
+    parser.add_argument("--latency", type=float, default=0.01, help="Seconds added by the fake server to every request")
+    parser.add_argument("--throttle_every", type=int, default=0, help="Fake server answers 429 to every Nth request")
+    parser.add_argument("--padding", type=int, default=0, help="Extra characters per track payload")
+    parser.add_argument("--out", type=str, help="JSON file of the results (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", type=str, help="JSON results of a previous run to compare with")
+    args = parser.parse_args()
+
+    report = {"metadata": metadata(args), "results": {}}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if "export" in args.only:
+            report["results"]["export"] = bench_export(args, tmpdir)
+            print("export", report["results"]["export"])
+
+        if set(args.only) - {"export"}:
+            history_path = os.path.join(tmpdir, "history")
+            history_seconds = timed(generate_history, history_path, args.artists, args.days, args.tracks,
+                                    "2023-01-01", args.seed)
+            report["results"]["history"] = {
+                "rows": args.artists * args.days * args.tracks,
+                "seconds": round(history_seconds, 4),
+                "db_bytes": os.path.getsize(os.path.join(history_path, "sql_files", "artists_data.db"))
+            }
+            print("history", report["results"]["history"])
+
+            with ConnectToSQLite(base_path=history_path) as database:
+                for name, benchmark in (("lookup", bench_lookup), ("dedup", bench_dedup), ("csv_export", bench_csv_export)):
+                    if name in args.only:
+                        report["results"][name] = benchmark(args, database)
+                        print(name, report["results"][name])
+
+    out = args.out or os.path.join("benchmarks", "results", f"{report['metadata']['timestamp'].replace(':', '-')}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as outfile:
+        json.dump(report, outfile, indent=2)
+    print(f"Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as infile:
+            baseline = json.load(infile)
+        print(f"\n{'metric':<60} {'baseline':>12} {'current':>12} {'ratio':>9}")
+        compare(report["results"], baseline["results"])
+
+if __name__ == "__main__":
+    main()
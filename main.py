@@ -1,5 +1,9 @@
-from src.data_exporter import DataExporter, DataProvider, DataAlreadyExistsError
+from src.data_provider import ConnectToSQLite, DataProvider, RedisQueryCache, DataAlreadyExistsError
+from src.metrics import Metrics
 import argparse
+import json
+import os
+import sys
 import time
 
 def main():
@@ -7,69 +11,284 @@ def main():
     
     Arguments:
         --export_data: Export data from Spotify API.
-        --get_artist_data (artist_name OR aritst_id): Return the most recent data from an artist.
-        --get_top_tracks_data (artist_name OR aritst_id): Return the most recent data from an artist.
+        --workers: Number of artists fetched concurrently when exporting.
+        --refresh_ids: Search every artist again instead of using the cached ids.
+        --ids_ttl (days): Search again the artists whose cached id is older than this.
+        --skip_duplicates: Insert only the new rows instead of aborting when some already exist.
+        --export_format (csv OR parquet): Format of the files written after each export.
+        --names_file: Read the artists names from this file (.json array, .jsonl or one name per line).
+        --chunk_size: Number of artists fetched and written per chunk when exporting.
+        --resume: Fetch only the artists not exported yet today (e.g. after a failed run).
+        --http_cache: Cache the Spotify API responses on disk and revalidate them with their ETag.
+        --http_cache_size (MB): Maximum size of the response cache.
+        --offline: Serve the Spotify API responses only from the response cache.
+        --markets (country code ...): Markets whose top tracks are exported (default: BR).
+        --get_artist_data (artist_name OR aritst_id ...): Return the most recent data from one or more artists.
+        --get_top_tracks_data (artist_name OR aritst_id ...): Return the most recent top tracks data from one or more artists.
+        --search_artist (text): Suggest artists whose name matches, starts with or resembles the text.
+        --get_artist_trends (artist_name OR aritst_id): Return the daily followers and popularity trends of an artist.
+        --get_track_trends (artist_name OR aritst_id): Return the daily popularity trends of the top tracks of an artist.
+        --start_date, --end_date (YYYY-MM-DD): Date range of the trends.
+        --window: Number of days of the trends rolling averages.
+        --market (country code): Return only the top tracks of this market.
+        --jsonl: Stream the lookup results as JSON lines (one artist per line).
+        --redis_url: Cache the lookup results in Redis until the next export.
+        --metrics_out: Write the counters and per-stage timings of the run to this JSON file.
+
+    Lookup values may be read from a file with one name or id per line: --get_artist_data @artists.txt
     """
     start_time = time.time()
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(fromfile_prefix_chars="@")
 
     parser.add_argument(
         "--export_data",
         action="store_true",
         help="Export data from Spotify API"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of artists fetched concurrently when exporting (default: 8)"
+    )
+    parser.add_argument(
+        "--refresh_ids",
+        action="store_true",
+        help="Search every artist again instead of using the cached ids"
+    )
+    parser.add_argument(
+        "--ids_ttl",
+        type=float,
+        help="Search again the artists whose cached id is older than this number of days"
+    )
+    parser.add_argument(
+        "--skip_duplicates",
+        action="store_true",
+        help="Insert only the new rows instead of aborting when some already exist"
+    )
+    parser.add_argument(
+        "--export_format",
+        choices=["csv", "parquet"],
+        default="csv",
+        help="Format of the files written after each export (parquet requires pyarrow)"
+    )
+    parser.add_argument(
+        "--names_file",
+        type=str,
+        help="Read the artists names from this file (.json array, .jsonl or one name per line)"
+    )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        help="Number of artists fetched and written per chunk when exporting (default: 500)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Fetch only the artists not exported yet today (e.g. after a failed run)"
+    )
+    parser.add_argument(
+        "--http_cache",
+        action="store_true",
+        help="Cache the Spotify API responses on disk and revalidate them with their ETag"
+    )
+    parser.add_argument(
+        "--http_cache_size",
+        type=float,
+        default=256,
+        help="Maximum size of the response cache in MB (default: 256)"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Serve the Spotify API responses only from the response cache, without network"
+    )
+    parser.add_argument(
+        "--markets",
+        nargs="+",
+        type=str.upper,
+        help="Markets (country codes) whose top tracks are exported (default: BR)"
+    )
     parser.add_argument(
         "--get_artist_data",
-        action="append",
+        action="extend",
+        nargs="+",
         type=str,
-        help="Return the most recent data from an artist"
+        help="Return the most recent data from one or more artists (@file reads one per line)"
     )
     parser.add_argument(
         "--get_top_tracks_data",
-        action="append",
+        action="extend",
+        nargs="+",
+        type=str,
+        help="Return the most recent top tracks data from one or more artists (@file reads one per line)"
+    )
+    parser.add_argument(
+        "--search_artist",
         type=str,
-        help="Return the most recent data from an artist"
+        help="Suggest artists whose name matches, starts with or resembles the text (ignoring case and accents)"
+    )
+    parser.add_argument(
+        "--get_artist_trends",
+        type=str,
+        help="Return the daily followers and popularity trends of an artist"
+    )
+    parser.add_argument(
+        "--get_track_trends",
+        type=str,
+        help="Return the daily popularity trends of the top tracks of an artist"
+    )
+    parser.add_argument(
+        "--start_date",
+        type=str,
+        help="First day of the trends (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--end_date",
+        type=str,
+        help="Last day of the trends (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--window",
+        type=int,
+        default=7,
+        help="Number of days of the trends rolling averages (default: 7)"
+    )
+    parser.add_argument(
+        "--market",
+        type=str.upper,
+        help="Return only the top tracks of this market (country code); all markets by default"
+    )
+    parser.add_argument(
+        "--jsonl",
+        action="store_true",
+        help="Stream the lookup results as JSON lines, one artist per line"
+    )
+
+    parser.add_argument(
+        "--redis_url",
+        type=str,
+        help="Cache the lookup results in Redis (e.g. redis://localhost:6379/0) until the next export"
+    )
+    parser.add_argument(
+        "--metrics_out",
+        type=str,
+        help="Write the counters and per-stage timings of the run to this JSON file"
     )
 
     args = parser.parse_args()
 
+    log = sys.stderr if args.jsonl else sys.stdout
+    database = ConnectToSQLite()
+    metrics = Metrics()
+    response_cache = None
+
     try:
-        print('Starting the program...')
-        exporter = DataExporter()
-        provider = DataProvider()
+        print('Starting the program...', file=log)
+        cache = RedisQueryCache(url=args.redis_url) if args.redis_url else None
+        provider = DataProvider(conn=database, cache=cache, metrics=metrics)
         
         if args.export_data:
-            exporter.export_data()
+            from src.data_exporter import ConsumeAPI, DataExporter, ResponseCache, MAX_WORKERS
+
+            if args.http_cache or args.offline:
+                response_cache = ResponseCache(
+                    os.path.join(database.check_path("http_cache"), "responses.db"),
+                    max_bytes=int(args.http_cache_size * 1024 * 1024),
+                    offline=args.offline
+                )
+            ids_ttl = args.ids_ttl * 86400 if args.ids_ttl is not None else None
+            chunk_size = {"chunk_size": args.chunk_size} if args.chunk_size else {}
+            exporter = DataExporter(
+                source=ConsumeAPI(max_workers=args.workers or MAX_WORKERS, metrics=metrics, response_cache=response_cache,
+                                  markets=args.markets),
+                conn=database,
+                ids_ttl=ids_ttl,
+                refresh_ids=args.refresh_ids,
+                skip_duplicates=args.skip_duplicates,
+                export_format=args.export_format,
+                names_path=args.names_file,
+                resume=args.resume,
+                metrics=metrics,
+                **chunk_size
+            )
+            num_inserted, num_duplicates, failed = exporter.export_data()
             print("Data exported successfully!")
+            print(f"{num_inserted} rows inserted, {num_duplicates} duplicated rows skipped.")
+            if failed:
+                print(f"{len(failed)} artists failed, run again with --resume to fetch only them:")
+                for artist_name, error in failed.items():
+                    print(f"  {artist_name}: {error}")
             
+        elif args.search_artist:
+            suggestions = provider.searchArtists(args.search_artist)[args.search_artist]
+            if not args.jsonl:
+                print("Here are the artists matching the search:")
+                print(60 * "-")
+            for suggestion in suggestions:
+                print(json.dumps(suggestion, ensure_ascii=False) if args.jsonl else suggestion)
+
+        elif args.get_artist_trends or args.get_track_trends:
+            if args.get_artist_trends:
+                artist = args.get_artist_trends
+                result = provider.getArtistTrends(artist, args.start_date, args.end_date, args.window)
+            else:
+                artist = args.get_track_trends
+                result = provider.getTrackTrends(artist, args.start_date, args.end_date, args.window, args.market)
+
+            if not args.jsonl:
+                print("Here are the daily trends from the artist:")
+                print(60 * "-")
+            for day in result[artist]:
+                print(json.dumps(day, ensure_ascii=False) if args.jsonl else day)
+
+        elif args.get_artist_data and args.jsonl:
+            for result in provider.iterRecentDataByArtists(args.get_artist_data):
+                print(json.dumps(result, ensure_ascii=False))
+
+        elif args.get_top_tracks_data and args.jsonl:
+            for result in provider.iterRecentTopTracksDataByArtists(args.get_top_tracks_data, args.market):
+                print(json.dumps(result, ensure_ascii=False))
+
         elif args.get_artist_data:
             print("Here is the most recent data from the artist:")
             print(60 * "-")
-            result = provider.getRecentDataByArtist(args.get_artist_data[0])
+            if len(args.get_artist_data) == 1:
+                result = provider.getRecentDataByArtist(args.get_artist_data[0])
+            else:
+                result = provider.getRecentDataByArtists(args.get_artist_data)
             print(result)
             
         elif args.get_top_tracks_data:
             print("Here is the most recent top tracks data from the artist:")
             print(60 * "-")
-            result = provider.getRecentTopTracksDataByArtist(args.get_top_tracks_data[0])
+            if len(args.get_top_tracks_data) == 1:
+                result = provider.getRecentTopTracksDataByArtist(args.get_top_tracks_data[0], args.market)
+            else:
+                result = provider.getRecentTopTracksDataByArtists(args.get_top_tracks_data, args.market)
             print(result)
             
         else:
             print("No option selected. Please, use --help to see the options.")    
              
     except ValueError as e:
-        print(f"ValueError: {e}")
+        print(f"ValueError: {e}", file=log)
     except DataAlreadyExistsError as e:
-        print(f"DataAlreadyExistsError: {e}")
+        print(f"DataAlreadyExistsError: {e}", file=log)
     except SystemExit as e:
-        print(f"SystemExit: {e}")
+        print(f"SystemExit: {e}", file=log)
     except Exception as e:
-        print(f"Error: {e}")
+        print(f"Error: {e}", file=log)
+    finally:
+        database.close_database()
+        if response_cache is not None:
+            response_cache.close()
+        if args.metrics_out:
+            metrics.write(args.metrics_out)
         
-    print(60 * "-")
+    print(60 * "-", file=log)
     end_time = time.time()
     total_time = end_time - start_time
-    print(f"\nRuntime: {round(total_time, 2)} seconds.")
+    print(f"\nRuntime: {round(total_time, 2)} seconds.", file=log)
 
 if __name__ == "__main__":
     main()
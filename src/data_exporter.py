@@ -1,329 +1,966 @@
 from dotenv import load_dotenv
 import os
 import base64
-from requests import post, get, exceptions
+from email.utils import parsedate_to_datetime
+import functools
+import itertools
+from requests import Session, adapters, exceptions
 import json
+import re
 import pandas as pd
-import os
 import sqlite3
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from src.metrics import Metrics
+from src.data_provider import (
+    DataAlreadyExistsError,
+    ConnectToSQLite,
+    DataProvider,
+    normalize_artist_name,
+    REFRESH_DAILY_STATS_STATEMENT,
+    REFRESH_LATEST_SNAPSHOT_STATEMENTS
+)
+
+__all__ = [
+    "ArtistIdCache",
+    "ArtistNotFoundError",
+    "ConnectToSQLite",
+    "ConsumeAPI",
+    "DataAlreadyExistsError",
+    "DataExporter",
+    "DataProvider",
+    "ExportJournal",
+    "RateLimiter",
+    "ResponseCache",
+    "SpotifyRequestError",
+    "TokenManager",
+    "COLUMNS",
+    "DTYPES"
+]
+
+API_URL = "https://api.spotify.com/v1"
+AUTH_URL = "https://accounts.spotify.com/api/token"
+TIMEOUT = (3.05, 10)
+POOL_SIZE = 10
+MAX_WORKERS = 8
+RATE_LIMIT = 10
+MAX_RETRIES = 5
+ARTIST_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Wait (seconds) on a 429 without a usable Retry-After header.
+RETRY_AFTER = 1.0
+# Raised while decoding a malformed response body.
+MALFORMED_RESPONSE_ERRORS = (KeyError, TypeError, ValueError)
+ARTISTS_BATCH_SIZE = 50
+EXPORT_CHUNK_SIZE = 50000
+NAMES_CHUNK_SIZE = 500
+NAMES_BUFFER_SIZE = 65536
+NAMES_WHITESPACE = re.compile(r"[ \t\r\n]*")
+# Longest item (characters) of the names array read before giving up on it.
+NAMES_MAX_ITEM_SIZE = 1024 * 1024
+HTTP_CACHE_SIZE = 256 * 1024 * 1024
+DEFAULT_MARKET = "BR"
+COLUMNS = [
+    "id_artist",
+    "query_date",
+    "artist_name",
+    "followers",
+    "artist_popularity",
+    "name_song",
+    "song_popularity",
+    "release_date",
+    "album_name",
+    "total_tracks",
+    "market"
+]
+# Dates stay as ISO strings: SQLite stores them as TEXT and release_date may be only "YYYY" or "YYYY-MM".
+DTYPES = {
+    "followers": "int64",
+    "artist_popularity": "int64",
+    "song_popularity": "int64",
+    "total_tracks": "int64"
+}
+
+class SpotifyRequestError(SystemExit):
+    """Raised when a request to Spotify API fails; exits the program unless handled."""
+    pass
+
+class ArtistNotFoundError(SpotifyRequestError):
+    """Raised when the Spotify search returns no artist for a name."""
+    pass
 
-class DataAlreadyExistsError(Exception):
-    """Raised when data already exists in the database."""
+class ResponseCacheMiss(exceptions.RequestException):
+    """Raised in offline mode when a response is not in the cache."""
     pass
 
+class TokenManager():
+    """Class to cache the Spotify API access token.
+    
+    Methods:
+        is_valid: Check if the cached token can still be used.
+        get_token: Return the cached token, requesting a new one when it is about to expire.
+        invalidate: Discard the cached token.
+        load_token: Load the cached token from disk.
+        save_token: Save the cached token to disk.
+    """
+    def __init__(self, request_token, cache_path=None, refresh_margin=60):
+        self.request_token = request_token
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.token = None
+        self.expires_at = 0.0
+        self.lock = threading.Lock()
+        self.load_token()
+
+    def is_valid(self) -> bool:
+        return self.token is not None and time.time() < self.expires_at - self.refresh_margin
+
+    def get_token(self) -> str:
+        with self.lock:
+            if not self.is_valid():
+                token, expires_in = self.request_token()
+                self.token = token
+                self.expires_at = time.time() + expires_in
+                self.save_token()
+
+            return self.token
+
+    def invalidate(self) -> None:
+        self.token = None
+        self.expires_at = 0.0
+
+        if self.cache_path and os.path.exists(self.cache_path):
+            os.remove(self.cache_path)
+
+    def load_token(self) -> None:
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+
+        try:
+            with open(self.cache_path, "r") as infile:
+                cached = json.load(infile)
+            self.token = cached["access_token"]
+            self.expires_at = float(cached["expires_at"])
+        except (OSError, ValueError, KeyError):
+            self.token = None
+            self.expires_at = 0.0
+
+    def save_token(self) -> None:
+        if not self.cache_path:
+            return
+
+        directory = os.path.dirname(self.cache_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w") as outfile:
+            json.dump({"access_token": self.token, "expires_at": self.expires_at}, outfile)
+        os.chmod(temp_path, 0o600)
+        os.replace(temp_path, self.cache_path)
+
+
+class RateLimiter():
+    """Class to share a request budget between threads (token bucket).
+    
+    Methods:
+        acquire: Block until a request can be sent.
+        pause: Hold every request for the given number of seconds (e.g. on 429 Retry-After).
+    """
+    def __init__(self, rate=RATE_LIMIT, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    elapsed = now - self.updated_at
+                    self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+                    self.updated_at = now
+
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+
+                    wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.updated_at = self.paused_until
+            self.tokens = 0
+
+
+class ResponseCache():
+    """Class to cache the Spotify API responses on disk, keyed by URL (LRU bounded by max_bytes).
+
+    A response is fresh for its Cache-Control max-age (default_ttl without one)
+    and then revalidated with If-None-Match when it has an ETag; no-store
+    responses are not kept. In offline mode every cached response is served,
+    fresh or not, and nothing is requested.
+    
+    Methods:
+        key: Return the cache key of a URL and its query parameters.
+        max_age: Return the lifetime of a response from its headers, or None when it must not be stored.
+        get: Return the (body, etag, fresh) entry of a key, or None when missing.
+        set: Store a response, evicting the least recently used ones over max_bytes.
+        touch: Renew the lifetime of a revalidated response.
+        close: Close the cache database.
+    """
+    def __init__(self, path: str, max_bytes=HTTP_CACHE_SIZE, default_ttl=0, offline=False):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        with self.conn:
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT NOT NULL PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    etag TEXT,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    size INTEGER NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self.size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def key(self, url: str, params=None) -> str:
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    def max_age(self, headers) -> float:
+        directives = [directive.strip().lower() for directive in headers.get("Cache-Control", "").split(",")]
+
+        if "no-store" in directives:
+            return None
+        if "no-cache" in directives:
+            return 0
+
+        for directive in directives:
+            if directive.startswith("max-age="):
+                try:
+                    return int(directive[len("max-age="):])
+                except ValueError:
+                    break
+
+        return self.default_ttl
+
+    def get(self, key: str):
+        now = time.time()
+
+        with self.lock, self.conn:
+            data = self.conn.execute("SELECT body, etag, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if not data:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return data[0], data[1], now < data[2]
+
+    def set(self, key: str, body: bytes, etag=None, max_age=0) -> None:
+        now = time.time()
+
+        with self.lock, self.conn:
+            previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("""
+                INSERT OR REPLACE INTO responses (key, body, etag, expires_at, accessed_at, size)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (key, body, etag, now + max_age, now, len(body)))
+            self.size += len(body) - (previous[0] if previous else 0)
+
+            if self.size > self.max_bytes:
+                evicted = []
+                for evicted_key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at"):
+                    if self.size <= self.max_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    self.size -= size
+                self.conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def touch(self, key: str, max_age=0) -> None:
+        now = time.time()
+
+        with self.lock, self.conn:
+            self.conn.execute("UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?", (now + max_age, now, key))
+
+    def close(self) -> None:
+        with self.lock:
+            self.conn.close()
+
+
 class ConsumeAPI():
     """Class to consume Spotify API.
     
     Methods:
-        get_token: Return the token to access Spotify API.
+        build_session: Build a pooled keep-alive HTTP session.
+        request_token: Request a new token and its lifetime from Spotify API.
+        get_token: Return the cached token to access Spotify API.
         get_auth_header: Return the authorization header to access Spotify API.
+        get_json: Return the JSON response from Spotify API (or the response cache), refreshing the token once on 401 and waiting on 429.
+        retry_after: Return the seconds to wait on a 429, from its Retry-After header (seconds or date).
         search_for_artist: Return the artist id from Spotify API.
         get_artist_info: Return the artist info from Spotify API.
+        get_several_artists_info: Return the info of up to 50 artists in a single request.
         get_songs_by_artist: Return the songs info from Spotify API.
-        dataframe_builder: Build the dataframe with the data from Spotify API.
-        get_songs_by_artists: Return the dataframe with the data from Spotify API.
+        fetch_with_retry: Call a request method with exponential backoff, returning the last error instead of raising it.
+        retryable: Tell if a failed request may succeed when sent again.
+        resolve_artists_ids: Return the artists ids, searching only the names missing from the cache.
+        dataframe_builder: Add the rows of an artist to the column buffers.
+        build_dataframe: Build the dataframe from the column buffers at once and clear them.
+        get_songs_by_artists: Return the dataframe with the data from Spotify API, fetching artists concurrently.
+
+    get_songs_by_artists aborts on the first artist that still fails after
+    artist_retries attempts, unless a failed dict is given: the failed artists
+    are then skipped and recorded in it with their error.
+
+    Every request is timed per endpoint (api.*) and counted, with its bytes
+    and retries, in metrics. With a response_cache, fresh responses are served
+    from disk and stale ones revalidated with their ETag.
+
+    The top tracks are fetched for every market in markets, concurrently;
+    the artist info is fetched once per artist whatever the number of markets.
     """
-    def __init__(self):
+    def __init__(self, session=None, api_url=API_URL, auth_url=AUTH_URL, timeout=TIMEOUT, pool_size=POOL_SIZE,
+                 max_workers=MAX_WORKERS, rate_limiter=None, max_retries=MAX_RETRIES,
+                 artist_retries=ARTIST_RETRIES, retry_backoff=RETRY_BACKOFF, metrics=None, response_cache=None,
+                 markets=None):
         self.dotenv = load_dotenv()
         self.client_id = os.getenv("CLIENT_ID")
         self.client_secret = os.getenv("CLIENT_SECRET")
-        self.df = pd.DataFrame(columns=[
-            "id_artist",
-            "query_date",
-            "artist_name",
-            "followers",
-            "artist_popularity",
-            "name_song",
-            "song_popularity",
-            "release_date",
-            "album_name",
-            "total_tracks"
-        ])
+        self.api_url = api_url
+        self.auth_url = auth_url
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.artist_retries = artist_retries
+        self.retry_backoff = retry_backoff
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.response_cache = response_cache
+        self.markets = list(markets) if markets else [DEFAULT_MARKET]
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        # Every worker thread keeps a connection, so the pool is never smaller than the workers.
+        self.session = session if session is not None else self.build_session(max(pool_size, max_workers))
+        self.token_manager = TokenManager(self.request_token, os.getenv("TOKEN_CACHE_PATH"))
+        self.records = {column: [] for column in COLUMNS}
+
+    def build_session(self, pool_size: int) -> Session:
+        session = Session()
+        adapter = adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+        return session
           
-    def get_token(self) -> str:
+    def request_token(self) -> tuple[str, int]:
         try:
             auth_string = self.client_id + ":" + self.client_secret
             auth_bytes = auth_string.encode("utf-8")
             auth_base64 = str(base64.b64encode(auth_bytes), "utf-8")
-            url = "https://accounts.spotify.com/api/token"
             headers = {
                 "Authorization": "Basic " + auth_base64,
                 "Content-Type": "application/x-www-form-urlencoded"
             }
             data = {"grant_type": "client_credentials"}
-            result = post(url, headers=headers, data=data)
+            with self.metrics.timer("api.token"):
+                result = self.session.post(self.auth_url, headers=headers, data=data, timeout=self.timeout)
+            self.metrics.increment("http.requests")
             result.raise_for_status()
             json_result = json.loads(result.content)
             token = json_result["access_token"]
+            expires_in = int(json_result.get("expires_in", 3600))
 
-            return token
+            return token, expires_in
 
         except exceptions.RequestException as e:
-            raise  SystemExit(e)
+            raise SpotifyRequestError(e)
+        # Not TypeError: missing credentials are a bug, not a bad response.
+        except (KeyError, ValueError) as e:
+            raise SpotifyRequestError(f"Malformed response: {e!r}")
+
+    def get_token(self) -> str:
+        return self.token_manager.get_token()
 
     def get_auth_header(self) -> dict:
         return{"Authorization": "Bearer " + self.get_token()}
 
-    def search_for_artist(self, artist_name:str) -> str:
-        try:
-            url = "http://api.spotify.com/v1/search"
+    def get_json(self, url: str, params=None, metric="api.request") -> dict:
+        cache = self.response_cache
+        cached = None
+
+        if cache is not None:
+            key = cache.key(url, params)
+            cached = cache.get(key)
+
+            if cached and (cached[2] or cache.offline):
+                self.metrics.increment("http.cache.hits")
+                return json.loads(cached[0])
+
+            self.metrics.increment("http.cache.misses")
+            if cache.offline:
+                raise ResponseCacheMiss(f"Not in the response cache: {key}")
+
+        refreshed = False
+
+        for _ in range(self.max_retries + 1):
+            with self.metrics.timer("http.rate_limit_wait"):
+                self.rate_limiter.acquire()
             headers = self.get_auth_header()
-            query = f"?q={artist_name}&type=artist&limit=1"
-            query_url = url + query
-            result = get(query_url, headers=headers)
+            if cached and cached[1]:
+                headers["If-None-Match"] = cached[1]
+            with self.metrics.timer(metric):
+                result = self.session.get(url, headers=headers, params=params, timeout=self.timeout)
+            self.metrics.increment("http.requests")
+            self.metrics.increment("http.bytes", len(result.content))
+
+            if result.status_code == 401 and not refreshed:
+                self.metrics.increment("http.retries.401")
+                self.token_manager.invalidate()
+                refreshed = True
+            elif result.status_code == 429:
+                self.metrics.increment("http.retries.429")
+                self.rate_limiter.pause(self.retry_after(result.headers))
+            else:
+                break
+
+        if result.status_code == 304 and cached:
+            self.metrics.increment("http.cache.revalidated")
+            cache.touch(key, cache.max_age(result.headers) or 0)
+            return json.loads(cached[0])
+
+        try:
             result.raise_for_status()
-            json_result = json.loads(result.content)["artists"]["items"]
-            
+        except exceptions.HTTPError:
+            self.metrics.increment("http.errors")
+            raise
+
+        if cache is not None:
+            max_age = cache.max_age(result.headers)
+            if max_age is not None:
+                cache.set(key, result.content, result.headers.get("ETag"), max_age)
+
+        return json.loads(result.content)
+
+    def retry_after(self, headers) -> float:
+        # Retry-After is either a number of seconds or an HTTP date.
+        value = headers.get("Retry-After")
+
+        if value is None:
+            return RETRY_AFTER
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return RETRY_AFTER
+
+    def search_for_artist(self, artist_name:str) -> str:
+        try:
+            url = f"{self.api_url}/search"
+            params = {"q": artist_name, "type": "artist", "limit": 1}
+            json_result = self.get_json(url, params, "api.search")["artists"]["items"]
+
+            if not json_result:
+                raise ArtistNotFoundError(f"No artist found for {artist_name!r}")
+
             return json_result[0]["id"]
         
         except exceptions.RequestException as e:
-            raise  SystemExit(e)
+            raise SpotifyRequestError(e)
+        except MALFORMED_RESPONSE_ERRORS as e:
+            raise SpotifyRequestError(f"Malformed response: {e!r}")
     
     def get_artist_info(self, artist_id: str) -> dict:
         try:
-            url = f"http://api.spotify.com/v1/artists/{artist_id}"
-            headers = self.get_auth_header()
-            result = get(url, headers=headers)
-            result.raise_for_status()
-            json_result = json.loads(result.content)
+            url = f"{self.api_url}/artists/{artist_id}"
+            json_result = self.get_json(url, metric="api.artist")
             
             return json_result
 
         except exceptions.RequestException as e:
-            raise  SystemExit(e)
+            raise SpotifyRequestError(e)
+        except MALFORMED_RESPONSE_ERRORS as e:
+            raise SpotifyRequestError(f"Malformed response: {e!r}")
 
-    def get_songs_by_artist(self, artist_id: str, country="BR"):
+    def get_several_artists_info(self, artists_ids: list) -> list[dict]:
         try:
-            url = f"http://api.spotify.com/v1/artists/{artist_id}/top-tracks?country={country}"
-            headers = self.get_auth_header()
-            result = get(url, headers=headers)
-            result.raise_for_status()
-            json_result = json.loads(result.content)["tracks"]
+            url = f"{self.api_url}/artists"
+            json_result = self.get_json(url, {"ids": ",".join(artists_ids)}, "api.artists")["artists"]
+
+            return json_result
+
+        except exceptions.RequestException as e:
+            raise SpotifyRequestError(e)
+        except MALFORMED_RESPONSE_ERRORS as e:
+            raise SpotifyRequestError(f"Malformed response: {e!r}")
+
+    def get_songs_by_artist(self, artist_id: str, country=DEFAULT_MARKET):
+        try:
+            url = f"{self.api_url}/artists/{artist_id}/top-tracks"
+            json_result = self.get_json(url, {"country": country}, "api.top_tracks")["tracks"]
             
             return json_result
         
         except exceptions.RequestException as e:
-            raise  SystemExit(e)
+            raise SpotifyRequestError(e)
+        except MALFORMED_RESPONSE_ERRORS as e:
+            raise SpotifyRequestError(f"Malformed response: {e!r}")
     
-    def dataframe_builder(self, artist_id: str) -> None:
-        artist_info = self.get_artist_info(artist_id)
-        songs_info = self.get_songs_by_artist(artist_id)
+    def fetch_with_retry(self, method, *args):
+        for attempt in range(self.artist_retries + 1):
+            if attempt > 0:
+                self.metrics.increment("api.retries")
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+            try:
+                return method(*args)
+            except SpotifyRequestError as e:
+                error = e
+                if not self.retryable(e):
+                    break
+
+        return error
+
+    def retryable(self, error: SpotifyRequestError) -> bool:
+        # Missing artists, offline cache misses and client errors (but 429) fail the same way again.
+        if isinstance(error, ArtistNotFoundError) or isinstance(error.code, ResponseCacheMiss):
+            return False
+        status_code = getattr(getattr(error.code, "response", None), "status_code", None)
+
+        return not (isinstance(status_code, int) and 400 <= status_code < 500 and status_code != 429)
+
+    def resolve_artists_ids(self, artists_list: list, executor, id_cache=None) -> list:
+        cached = {name: id_cache.get(name) for name in artists_list} if id_cache else {}
+        missing = [name for name in dict.fromkeys(artists_list) if not cached.get(name)]
+        self.metrics.increment("artists.ids_searched", len(missing))
+        search = functools.partial(self.fetch_with_retry, self.search_for_artist)
+        resolved = dict(zip(missing, executor.map(search, missing)))
+        found = {name: artist_id for name, artist_id in resolved.items() if not isinstance(artist_id, SpotifyRequestError)}
+
+        if id_cache and found:
+            id_cache.update(found)
+
+        return [cached.get(name) or resolved[name] for name in artists_list]
+
+    def dataframe_builder(self, artist_id: str, artist_info=None, songs_info=None, market=DEFAULT_MARKET) -> None:
+        if artist_info is None:
+            artist_info = self.get_artist_info(artist_id)
+        if songs_info is None:
+            songs_info = self.get_songs_by_artist(artist_id, market)
         query_date = pd.Timestamp.now().strftime("%Y-%m-%d") 
+        records = self.records
         
         for song in songs_info:
-            self.df = self.df._append({
-                "id_artist": artist_id,
-                "query_date": query_date,
-                "artist_name": artist_info["name"],
-                "followers": artist_info["followers"]["total"],
-                "artist_popularity": artist_info["popularity"],
-                "name_song": song["name"],
-                "song_popularity": song["popularity"],
-                "release_date": song["album"]["release_date"],
-                "album_name": song["album"]["name"],
-                "total_tracks": song["album"]["total_tracks"]
-            }, ignore_index=True)
+            records["id_artist"].append(artist_id)
+            records["query_date"].append(query_date)
+            records["artist_name"].append(artist_info["name"])
+            records["followers"].append(artist_info["followers"]["total"])
+            records["artist_popularity"].append(artist_info["popularity"])
+            records["name_song"].append(song["name"])
+            records["song_popularity"].append(song["popularity"])
+            records["release_date"].append(song["album"]["release_date"])
+            records["album_name"].append(song["album"]["name"])
+            records["total_tracks"].append(song["album"]["total_tracks"])
+            records["market"].append(market)
+
+    def build_dataframe(self) -> pd.DataFrame:
+        with self.metrics.timer("dataframe.build"):
+            df = pd.DataFrame(self.records, columns=COLUMNS).astype(DTYPES)
+        self.records = {column: [] for column in COLUMNS}
+
+        return df
                    
-    def get_songs_by_artists(self, artists_list: list) -> pd.DataFrame:
-        for artist in artists_list:
-            id_artist = self.search_for_artist(artist)
-            self.dataframe_builder(id_artist)
+    def get_songs_by_artists(self, artists_list: list, id_cache=None, failed=None) -> pd.DataFrame:
+        def skip_failed(names, *results):
+            for result in results:
+                if isinstance(result, SpotifyRequestError):
+                    if failed is None:
+                        raise result
+                    failed.update(dict.fromkeys(names, str(result)))
+                    return True
+
+            return False
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            resolved = self.resolve_artists_ids(artists_list, executor, id_cache)
+            # Repeated names, or names of the same artist, are fetched once (and fail together).
+            names_by_id = {}
+            for name, artist_id in zip(artists_list, resolved):
+                if not skip_failed([name], artist_id):
+                    names_by_id.setdefault(artist_id, []).append(name)
+            artists_ids = list(names_by_id)
+            batches = [
+                artists_ids[i:i + ARTISTS_BATCH_SIZE]
+                for i in range(0, len(artists_ids), ARTISTS_BATCH_SIZE)
+            ]
+            artists_info = executor.map(functools.partial(self.fetch_with_retry, self.get_several_artists_info), batches)
+            # One top tracks request per artist and market, in artist order.
+            songs_info = executor.map(
+                functools.partial(self.fetch_with_retry, self.get_songs_by_artist),
+                [artist_id for artist_id in artists_ids for _ in self.markets],
+                self.markets * len(artists_ids)
+            )
+            # Artist info is matched by id, whatever the order of the response; a failed batch fails every artist in it.
+            info_by_id = {}
+            for batch, batch_info in zip(batches, artists_info):
+                if isinstance(batch_info, SpotifyRequestError):
+                    info_by_id.update(dict.fromkeys(batch, batch_info))
+                else:
+                    info_by_id.update((artist_info.get("id"), artist_info) for artist_info in batch_info if artist_info)
+            artists_info = [info_by_id.get(artist_id) for artist_id in artists_ids]
+            # Artists missing from a batch (null or left out) are fetched one by one, once whatever the markets.
+            missing = [index for index, artist_info in enumerate(artists_info) if artist_info is None]
+            fallback = executor.map(
+                functools.partial(self.fetch_with_retry, self.get_artist_info),
+                [artists_ids[index] for index in missing]
+            )
+            for index, artist_info in zip(missing, fallback):
+                artists_info[index] = artist_info
+
+            for id_artist, artist_info in zip(artists_ids, artists_info):
+                markets_songs = [next(songs_info) for _ in self.markets]
+
+                if not skip_failed(names_by_id[id_artist], artist_info, *markets_songs):
+                    for market, songs in zip(self.markets, markets_songs):
+                        self.dataframe_builder(id_artist, artist_info, songs, market)
             
-        return self.df
+        return self.build_dataframe()
 
 
-class ConnectToSQLite():
-    """Class to connect to SQLite database.
+class ArtistIdCache():
+    """Class to cache the artist name to id resolution in SQLite database.
     
     Methods:
-        check_path: Check if the path exists, if not, create it.
-        create_database: Create the database if not exists.
-        connect_database: Connect to the database.
+        get: Return the cached id of an artist name, or None when missing, expired or refreshing.
+        update: Store the resolved ids of the artists names.
     """
-    def __init__(self):
-        self.database_name = "artists_data.db"
-        self.database_file = "sql_files"
-        
-    def check_path(self, paste:str) -> str:
-        path = os.path.join("src", "data_files", paste)
+    def __init__(self, conn: sqlite3.Connection, ttl=None, refresh=False):
+        self.conn = conn
+        self.ttl = ttl
+        self.refresh = refresh
 
-        if not os.path.exists(path):
-            os.makedirs(path)
-            
-        return path
+    def get(self, artist_name: str) -> str:
+        if self.refresh:
+            return None
+
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT id_artist, resolved_at FROM artist_ids
+            WHERE search_name = ?
+        """, (normalize_artist_name(artist_name),))
+        data = cursor.fetchone()
+
+        if not data or (self.ttl is not None and time.time() - data[1] > self.ttl):
+            return None
+
+        return data[0]
+
+    def update(self, resolved: dict) -> None:
+        resolved_at = time.time()
+
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO artist_ids (search_name, id_artist, resolved_at)
+                VALUES (?, ?, ?)
+            """, [
+                (normalize_artist_name(name), artist_id, resolved_at)
+                for name, artist_id in resolved.items()
+            ])
+
+
+class ExportJournal():
+    """Class to track the artists exported on a query date in SQLite database.
     
-    def create_database(self) -> None:
-        path = self.check_path(self.database_file)
-        full_path = os.path.join(path, self.database_name)
-        conn = sqlite3.connect(full_path)
-        cursor = conn.cursor()
+    Methods:
+        completed: Return the normalized names of the artists already exported.
+        failures: Return the artists that failed and their last error.
+        record: Mark the artists as done or failed, inside the caller's transaction.
+    """
+    def __init__(self, conn: sqlite3.Connection, query_date: str):
+        self.conn = conn
+        self.query_date = query_date
+
+    def completed(self) -> set[str]:
+        cursor = self.conn.cursor()
         cursor.execute("""
-            CREATE TABLE artists_data (
-                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
-                id_artist VARCHAR(255) NOT NULL,
-                query_date DATE NOT NULL,
-                artist_name VARCHAR(255) NOT NULL,
-                followers INTEGER NOT NULL,
-                artist_popularity INTEGER NOT NULL,
-                name_song VARCHAR(255) NOT NULL,
-                song_popularity INTEGER NOT NULL,
-                release_date DATE NOT NULL,
-                album_name VARCHAR(255) NOT NULL,
-                total_tracks INTEGER NOT NULL
-            );
-        """)
-        conn.commit()
-        conn.close()
-        
-    def connect_database(self) -> sqlite3.Connection:
-        path = self.check_path(self.database_file)
-        full_path = os.path.join(path, self.database_name)
-        
-        if not os.path.exists(full_path):
-            self.create_database()
+            SELECT search_name FROM export_journal
+            WHERE query_date = ? AND status = 'done'
+        """, (self.query_date,))
 
-        conn = sqlite3.connect(full_path)
-        
-        return conn
+        return {row[0] for row in cursor}
+
+    def failures(self) -> dict:
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT search_name, error FROM export_journal
+            WHERE query_date = ? AND status = 'failed'
+        """, (self.query_date,))
+
+        return dict(cursor.fetchall())
+
+    def record(self, done: list, failed: dict) -> None:
+        updated_at = time.time()
+        entries = [(name, "done", None) for name in done]
+        entries += [(name, "failed", error) for name, error in failed.items()]
+        self.conn.executemany("""
+            INSERT INTO export_journal (query_date, search_name, status, attempts, error, updated_at)
+            VALUES (?, ?, ?, 1, ?, ?)
+            ON CONFLICT (query_date, search_name) DO UPDATE SET
+                status = excluded.status,
+                attempts = attempts + 1,
+                error = excluded.error,
+                updated_at = excluded.updated_at
+        """, [
+            (self.query_date, normalize_artist_name(name), status, error, updated_at)
+            for name, status, error in entries
+        ])
 
 
 class DataExporter():
     """Class to export data from Spotify API.
+
+    Names are streamed from the names file and exported in chunks of
+    chunk_size artists, each one fetched and written in its own transaction,
+    so memory does not grow with the roster. Every insert that adds rows also
+    bumps data_version, which invalidates the DataProvider query cache.
+
+    Artists that still fail after the retries are skipped and recorded in the
+    export journal together with the ones written, in the same transaction;
+    with resume the artists already exported on the day are not fetched again.
+
+    Each stage (fetch, insert, file export) is timed and the rows and artists
+    are counted in metrics.
     
     Methods:
-        import_artists_names: Import the artists names from JSON file.
-        export_data: Export the data from Spotify API to SQLite database.
+        import_artists_names: Return the artists names as a list (None when the file is missing or invalid).
+        iter_artists_names: Yield the artists names from a JSON array or a newline-delimited file.
+        iter_json_array: Yield the items of a JSON array without loading the whole file.
+        export_sql_to_csv: Append the rows not exported yet to one file per query_date (CSV or Parquet).
+        export_data: Export the data from Spotify API to SQLite database and return the inserted and duplicated counts and the failed artists.
+        insert_data_db: Insert the new rows in the normalized tables and return the inserted and duplicated counts.
+        refresh_latest_snapshot: Replace the latest snapshot of the given (id_artist, market, query_date) keys.
+        refresh_daily_stats: Recompute the daily aggregates of the given (id_artist, query_date) pairs.
     """
-    def __init__(self, source=ConsumeAPI(), conn=ConnectToSQLite()):
-        self.source = source
-        self.conn = conn
+    def __init__(self, source=None, conn=None, ids_ttl=None, refresh_ids=False,
+                 skip_duplicates=False, export_format="csv", names_path=None, chunk_size=NAMES_CHUNK_SIZE,
+                 resume=False, metrics=None):
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.source = source if source is not None else ConsumeAPI(metrics=self.metrics)
+        self.conn = conn if conn is not None else ConnectToSQLite()
+        self.ids_ttl = ids_ttl
+        self.refresh_ids = refresh_ids
+        self.skip_duplicates = skip_duplicates
+        self.export_format = export_format
+        self.names_path = names_path
+        self.chunk_size = chunk_size
+        self.resume = resume
     
     def import_artists_names(self) -> list[str]:
         try:
-            path = self.conn.check_path("artists_names")
-            with open(f"{path}/names.json", "r") as infile:
-                names = json.load(infile)
-            
-            return names
+            return list(self.iter_artists_names())
         
         except FileNotFoundError as e:
             print(f"File not found: {e}")
         except json.JSONDecodeError as e:
             print(f"Error decoding JSON: {e}")
+
+    def iter_artists_names(self):
+        path = self.names_path or os.path.join(self.conn.check_path("artists_names"), "names.json")
+
+        with open(path, "r", encoding="utf-8") as infile:
+            if path.endswith(".json"):
+                yield from self.iter_json_array(infile)
+            else:
+                for line in infile:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line) if path.endswith((".jsonl", ".ndjson")) else line
+
+    def iter_json_array(self, infile):
+        # Strict like json.load, but holds one buffer (plus the item being read) at a time.
+        decoder = json.JSONDecoder()
+        buffer, position = "", 0
+
+        def next_char() -> str:
+            # The next character after whitespace ("" at the end of the file), reading more input as needed.
+            nonlocal buffer, position
+            while True:
+                position = NAMES_WHITESPACE.match(buffer, position).end()
+                if position < len(buffer):
+                    return buffer[position]
+                buffer, position = infile.read(NAMES_BUFFER_SIZE), 0
+                if not buffer:
+                    return ""
+
+        def next_value():
+            # A value is only complete once something follows it (or the file ends).
+            nonlocal buffer, position
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    error = None
+                    if end < len(buffer):
+                        position = end
+                        return value
+                except json.JSONDecodeError as e:
+                    error = e
+
+                chunk = infile.read(NAMES_BUFFER_SIZE)
+                if not chunk:
+                    if error:
+                        raise error
+                    position = end
+                    return value
+                if error and len(buffer) - position > NAMES_MAX_ITEM_SIZE:
+                    raise error
+                buffer, position = buffer[position:] + chunk, 0
+
+        if next_char() != "[":
+            raise json.JSONDecodeError("Expecting '['", buffer, position)
+        position += 1
+
+        if next_char() != "]":
+            while True:
+                if next_char() in ("", ",", "]"):
+                    raise json.JSONDecodeError("Expecting value", buffer, position)
+                yield next_value()
+
+                char = next_char()
+                position += 1
+                if char == "]":
+                    break
+                if char != ",":
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, position - 1)
+        else:
+            position += 1
+
+        if next_char():
+            raise json.JSONDecodeError("Extra data", buffer, position)
             
     def export_sql_to_csv(self, conn) -> None:
-        df = pd.read_sql_query("SELECT * FROM artists_data", conn)
-        path = self.conn.check_path("csv_files")
-        full_path = os.path.join(path, "artists_data.csv")
-        df.to_csv(full_path, index=False)
+        cursor = conn.cursor()
+        cursor.execute("SELECT last_id FROM export_watermark WHERE export_format = ?", (self.export_format,))
+        data = cursor.fetchone()
+        last_id = data[0] if data else 0
+        path = self.conn.check_path(f"{self.export_format}_files")
+        chunks = pd.read_sql_query(
+            "SELECT * FROM artists_data WHERE id > ? ORDER BY id",
+            conn,
+            params=(last_id,),
+            chunksize=EXPORT_CHUNK_SIZE
+        )
+
+        for df in chunks:
+            if df.empty:
+                continue
+
+            for query_date, partition in df.groupby("query_date", sort=True):
+                if self.export_format == "parquet":
+                    partition_path = os.path.join(path, f"query_date={query_date}")
+                    os.makedirs(partition_path, exist_ok=True)
+                    full_path = os.path.join(partition_path, f"part-{partition['id'].iloc[0]}.parquet")
+                    partition.to_parquet(full_path, index=False)
+                else:
+                    full_path = os.path.join(path, f"artists_data_{query_date}.csv")
+                    partition.to_csv(full_path, mode="a", header=not os.path.exists(full_path), index=False)
+
+            self.metrics.increment("rows.exported", len(df))
+            with conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO export_watermark (export_format, last_id)
+                    VALUES (?, ?)
+                """, (self.export_format, int(df["id"].max())))
         
-    def export_data(self) -> None:
-        name_list = self.import_artists_names()
-        df = self.source.get_songs_by_artists(name_list)
+    def export_data(self) -> tuple[int, int, dict]:
+        names = self.iter_artists_names()
         conn = self.conn.connect_database()
+        id_cache = ArtistIdCache(conn, self.ids_ttl, self.refresh_ids)
+        journal = ExportJournal(conn, pd.Timestamp.now().strftime("%Y-%m-%d"))
+        num_inserted = num_duplicates = 0
+        failed = {}
 
-        num_duplicates = 0
+        if self.resume:
+            completed = journal.completed()
+            names = (name for name in names if normalize_artist_name(name) not in completed)
 
-        try:
-            for _, row in df.iterrows():
-                if self.check_data_db(conn, pd.DataFrame([row])):
-                    num_duplicates += 1
+        while True:
+            name_list = list(itertools.islice(names, self.chunk_size))
+            if not name_list:
+                break
 
-            if num_duplicates > 0:
-                raise DataAlreadyExistsError(f"{num_duplicates} rows already exist in the database.")
-            else:
-                df.to_sql("artists_data", con=conn, if_exists="append", index=False)
+            chunk_failed = {}
+            with self.metrics.timer("export.fetch"):
+                df = self.source.get_songs_by_artists(name_list, id_cache, chunk_failed)
+            done = [name for name in name_list if name not in chunk_failed]
+            self.metrics.increment("artists.exported", len(done))
+            self.metrics.increment("artists.failed", len(chunk_failed))
+            chunk_inserted, chunk_duplicates = self.insert_data_db(
+                conn, df, lambda: journal.record(done, chunk_failed)
+            )
+            num_inserted += chunk_inserted
+            num_duplicates += chunk_duplicates
+            failed.update(chunk_failed)
+
+        if num_inserted > 0:
+            with self.metrics.timer("export.files"):
                 self.export_sql_to_csv(conn)
 
-        finally:
-            conn.close()
+        return num_inserted, num_duplicates, failed
         
-    def check_data_db(self, conn: sqlite3.Connection, df: pd.DataFrame) -> bool:
-        with conn:
-            cursor = conn.cursor()
+    def insert_data_db(self, conn: sqlite3.Connection, df: pd.DataFrame, before_commit=None) -> tuple[int, int]:
+        if "market" not in df:
+            df = df.assign(market=DEFAULT_MARKET)
+        rows = list(df[COLUMNS].itertuples(index=False, name=None))
 
-            for _, row in df.iterrows():
-                cursor.execute("""
-                    SELECT * FROM artists_data
-                    WHERE id_artist = ? AND query_date = ? AND name_song = ?
-                """, (row["id_artist"], row["query_date"], row["name_song"]))
-                
-                data = cursor.fetchone()
+        with self.metrics.timer("db.insert"), conn:
+            num_inserted = self.conn.insert_rows(conn, rows)
+            num_duplicates = len(rows) - num_inserted
 
-                if not data:
-                    return False  
+            if num_duplicates > 0 and not self.skip_duplicates:
+                # A row repeated in the frame is inserted once, only rows already stored abort the insert.
+                num_duplicates = len(df.drop_duplicates(subset=["id_artist", "query_date", "name_song", "market"])) - num_inserted
+                if num_duplicates > 0:
+                    raise DataAlreadyExistsError(f"{num_duplicates} rows already exist in the database.")
 
-            return True 
+            if num_inserted > 0:
+                with self.metrics.timer("db.refresh_derived"):
+                    self.refresh_latest_snapshot(conn, df[["id_artist", "market", "query_date"]].drop_duplicates().itertuples(index=False, name=None))
+                    self.refresh_daily_stats(conn, df[["id_artist", "query_date"]].drop_duplicates().itertuples(index=False, name=None))
+                conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
 
+            if before_commit is not None:
+                before_commit()
 
-class DataProvider():
-    """Class to query data from SQLite database.
-    
-    Methods:
-        getRecentDataByArtist: Return the most recent data from an artist.
-        getRecentTopTracksDataByArtist: Return the most recent top tracks data from an artist.
-    """
-    def __init__(self, source=DataExporter(), conn=ConnectToSQLite()):
-        self.source = source
-        self.conn = conn
-    
-    def getRecentDataByArtist(self, artist: str) -> dict:
-        conn = self.conn.connect_database()
-        with conn:
-            cursor = conn.cursor()
-            cursor.execute(f"""
-                SELECT * FROM artists_data
-                WHERE id_artist = '{artist}'
-                OR artist_name = '{artist}'
-                ORDER BY query_date DESC
-                LIMIT 1;
-            """)
-            data = cursor.fetchone()
-            
-            if data:
-                dict_result = {
-                    "id_artist": data[1],
-                    "query_date": data[2],
-                    "artist_name": data[3],
-                    "followers": data[4],
-                    "artist_popularity": data[5]
-                }
-            else:
-                raise ValueError("Artist not found.")
-            
-            dict_result = {artist: dict_result}
-            
-            return dict_result
-    
-    def getRecentTopTracksDataByArtist(self, artist: str) -> list:
-        conn = self.conn.connect_database()
-        with conn:
-            cursor = conn.cursor()
-            cursor.execute(f"""
-                SELECT * FROM artists_data
-                WHERE id_artist = '{artist}'
-                OR artist_name = '{artist}'
-                ORDER BY query_date DESC
-                LIMIT 10;
-            """)
-            data = cursor.fetchall()
-
-            tracks_data = []
-            if data:
-                for track in data:
-                    dict_result = {
-                        "id_artist": track[1],
-                        "query_date": track[2],
-                        "name_song": track[6],
-                        "song_popularity": track[7],
-                        "release_date": track[8],
-                        "album_name": track[9],
-                        "total_tracks": track[10]
-                    }
-                    tracks_data.append(dict_result)
-            else:
-                raise ValueError("Artist not found.")
+        self.metrics.increment("rows.inserted", num_inserted)
+        self.metrics.increment("rows.skipped", num_duplicates)
 
-            dict_result = {artist: tracks_data}
-            
-            return dict_result
+        return num_inserted, num_duplicates
+
+    def refresh_latest_snapshot(self, conn: sqlite3.Connection, keys) -> None:
+        keys = list(keys)
+        for statement in REFRESH_LATEST_SNAPSHOT_STATEMENTS:
+            conn.executemany(statement, keys)
+
+    def refresh_daily_stats(self, conn: sqlite3.Connection, keys) -> None:
+        conn.executemany(REFRESH_DAILY_STATS_STATEMENT, list(keys))
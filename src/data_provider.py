@@ -0,0 +1,1001 @@
+from collections import OrderedDict
+import functools
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from src.metrics import Metrics
+
+class DataAlreadyExistsError(Exception):
+    """Raised when data already exists in the database."""
+    pass
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "busy_timeout": 5000
+}
+
+# Seconds a cached lookup trusts the data version before reading it again
+# (writes on the same connection are seen at once).
+DATA_VERSION_RECHECK = 1.0
+# Suggestions scanned per requested one, before ranking them.
+SEARCH_CANDIDATES = 5
+# Minimum similarity (difflib ratio) of a fuzzy suggestion.
+SEARCH_CUTOFF = 0.5
+# Fuzzy searches are split in up to this many pieces of at least 4 characters;
+# a name within (pieces - 1) typos of the search still contains one of them.
+SEARCH_PIECES = 3
+
+def normalize_artist_name(artist_name: str) -> str:
+    return " ".join(artist_name.casefold().split())
+
+def fold_artist_name(artist_name: str) -> str:
+    """Return the name normalized and without accents, e.g. "Grupo Menos é Mais" -> "grupo menos e mais"."""
+    decomposed = unicodedata.normalize("NFKD", normalize_artist_name(artist_name))
+
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+MIGRATIONS = [
+    # 1: artist name to id resolution cache, seeded from the artists already stored.
+    """
+    CREATE TABLE artist_ids (
+        search_name VARCHAR(255) NOT NULL PRIMARY KEY,
+        id_artist VARCHAR(255) NOT NULL,
+        resolved_at REAL NOT NULL
+    );
+    INSERT OR IGNORE INTO artist_ids (search_name, id_artist, resolved_at)
+    SELECT normalize_name(artist_name), id_artist, CAST(strftime('%s', 'now') AS REAL)
+    FROM artists_data;
+    """,
+    # 2: unique snapshot key, so duplicates are rejected by the database itself.
+    """
+    DELETE FROM artists_data WHERE id NOT IN (
+        SELECT MIN(id) FROM artists_data GROUP BY id_artist, query_date, name_song
+    );
+    CREATE UNIQUE INDEX artists_data_snapshot_key ON artists_data (id_artist, query_date, name_song);
+    """,
+    # 3: lookup by artist name; lookups by id are served by artists_data_snapshot_key.
+    """
+    CREATE INDEX artists_data_name_date ON artists_data (artist_name, query_date, id_artist);
+    """,
+    # 4: newest snapshot of each artist, refreshed by every export.
+    """
+    CREATE TABLE latest_snapshot (
+        id INTEGER NOT NULL PRIMARY KEY,
+        id_artist VARCHAR(255) NOT NULL,
+        query_date DATE NOT NULL,
+        artist_name VARCHAR(255) NOT NULL,
+        followers INTEGER NOT NULL,
+        artist_popularity INTEGER NOT NULL,
+        name_song VARCHAR(255) NOT NULL,
+        song_popularity INTEGER NOT NULL,
+        release_date DATE NOT NULL,
+        album_name VARCHAR(255) NOT NULL,
+        total_tracks INTEGER NOT NULL
+    );
+    CREATE INDEX latest_snapshot_id_artist ON latest_snapshot (id_artist);
+    CREATE INDEX latest_snapshot_artist_name ON latest_snapshot (artist_name);
+    INSERT INTO latest_snapshot
+    SELECT * FROM artists_data AS data
+    WHERE query_date = (
+        SELECT MAX(query_date) FROM artists_data WHERE id_artist = data.id_artist
+    );
+    """,
+    # 5: last artists_data id written by the incremental file export, per format.
+    """
+    CREATE TABLE export_watermark (
+        export_format VARCHAR(255) NOT NULL PRIMARY KEY,
+        last_id INTEGER NOT NULL
+    );
+    """,
+    # 6: counter bumped by every export that changes the data, used to invalidate cached query results.
+    """
+    CREATE TABLE data_version (
+        id INTEGER NOT NULL PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT INTO data_version (id, version) VALUES (1, 0);
+    """,
+    # 7: artists already exported (or failed) on each query date, used to resume an interrupted export.
+    """
+    CREATE TABLE export_journal (
+        query_date DATE NOT NULL,
+        search_name VARCHAR(255) NOT NULL,
+        status VARCHAR(255) NOT NULL,
+        attempts INTEGER NOT NULL,
+        error TEXT,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (query_date, search_name)
+    );
+    """,
+    # 8: per artist and day aggregates for the trend queries, refreshed by every export.
+    """
+    CREATE TABLE artist_daily_stats (
+        id_artist VARCHAR(255) NOT NULL,
+        query_date DATE NOT NULL,
+        artist_name VARCHAR(255) NOT NULL,
+        followers INTEGER NOT NULL,
+        artist_popularity INTEGER NOT NULL,
+        avg_song_popularity REAL NOT NULL,
+        num_tracks INTEGER NOT NULL,
+        PRIMARY KEY (id_artist, query_date)
+    ) WITHOUT ROWID;
+    CREATE INDEX artist_daily_stats_date ON artist_daily_stats (query_date, followers);
+    INSERT INTO artist_daily_stats
+    SELECT id_artist, query_date, MAX(artist_name), MAX(followers), MAX(artist_popularity),
+        AVG(song_popularity), COUNT(*)
+    FROM artists_data
+    GROUP BY id_artist, query_date;
+    """,
+    # 9: top tracks per market; the rows stored so far are from Brazil.
+    """
+    ALTER TABLE artists_data ADD COLUMN market VARCHAR(2) NOT NULL DEFAULT 'BR';
+    DROP INDEX artists_data_snapshot_key;
+    CREATE UNIQUE INDEX artists_data_snapshot_key ON artists_data (id_artist, query_date, market, name_song);
+    ALTER TABLE latest_snapshot ADD COLUMN market VARCHAR(2) NOT NULL DEFAULT 'BR';
+    """,
+    # 10: normalized storage; artists, albums and tracks are stored once and the
+    # snapshots reference them by integer keys. artists_data becomes a read-only
+    # view with the same columns and ids, written through ConnectToSQLite.insert_rows.
+    """
+    CREATE TABLE artists (
+        artist_key INTEGER NOT NULL PRIMARY KEY,
+        id_artist VARCHAR(255) NOT NULL UNIQUE,
+        artist_name VARCHAR(255) NOT NULL
+    );
+    CREATE TABLE albums (
+        album_key INTEGER NOT NULL PRIMARY KEY,
+        album_name VARCHAR(255) NOT NULL,
+        release_date DATE NOT NULL,
+        total_tracks INTEGER NOT NULL,
+        UNIQUE (album_name, release_date, total_tracks)
+    );
+    CREATE TABLE tracks (
+        track_key INTEGER NOT NULL PRIMARY KEY,
+        artist_key INTEGER NOT NULL REFERENCES artists (artist_key),
+        name_song VARCHAR(255) NOT NULL,
+        UNIQUE (artist_key, name_song)
+    );
+    CREATE TABLE artist_snapshots (
+        artist_key INTEGER NOT NULL REFERENCES artists (artist_key),
+        query_date DATE NOT NULL,
+        followers INTEGER NOT NULL,
+        artist_popularity INTEGER NOT NULL,
+        PRIMARY KEY (artist_key, query_date)
+    ) WITHOUT ROWID;
+    CREATE TABLE track_snapshots (
+        id INTEGER NOT NULL PRIMARY KEY,
+        track_key INTEGER NOT NULL REFERENCES tracks (track_key),
+        query_date DATE NOT NULL,
+        market VARCHAR(2) NOT NULL,
+        album_key INTEGER NOT NULL REFERENCES albums (album_key),
+        song_popularity INTEGER NOT NULL,
+        UNIQUE (track_key, query_date, market)
+    );
+    INSERT INTO artists (id_artist, artist_name)
+    SELECT id_artist, artist_name FROM (
+        SELECT id_artist, artist_name, MAX(id) FROM artists_data GROUP BY id_artist
+    );
+    INSERT OR IGNORE INTO albums (album_name, release_date, total_tracks)
+    SELECT album_name, release_date, total_tracks FROM artists_data ORDER BY id;
+    INSERT OR IGNORE INTO tracks (artist_key, name_song)
+    SELECT artists.artist_key, data.name_song
+    FROM artists_data AS data JOIN artists ON artists.id_artist = data.id_artist
+    ORDER BY data.id;
+    INSERT INTO artist_snapshots (artist_key, query_date, followers, artist_popularity)
+    SELECT artist_key, query_date, followers, artist_popularity FROM (
+        SELECT artists.artist_key, data.query_date, data.followers, data.artist_popularity, MIN(data.id)
+        FROM artists_data AS data JOIN artists ON artists.id_artist = data.id_artist
+        GROUP BY artists.artist_key, data.query_date
+    );
+    INSERT INTO track_snapshots (id, track_key, query_date, market, album_key, song_popularity)
+    SELECT data.id, tracks.track_key, data.query_date, data.market, albums.album_key, data.song_popularity
+    FROM artists_data AS data
+    JOIN artists ON artists.id_artist = data.id_artist
+    JOIN tracks ON tracks.artist_key = artists.artist_key AND tracks.name_song = data.name_song
+    JOIN albums ON albums.album_name = data.album_name AND albums.release_date = data.release_date
+        AND albums.total_tracks = data.total_tracks
+    ORDER BY data.id;
+    DROP TABLE artists_data;
+    CREATE VIEW artists_data AS
+    SELECT track_snapshots.id, artists.id_artist, track_snapshots.query_date, artists.artist_name,
+        artist_snapshots.followers, artist_snapshots.artist_popularity, tracks.name_song,
+        track_snapshots.song_popularity, albums.release_date, albums.album_name, albums.total_tracks,
+        track_snapshots.market
+    FROM track_snapshots
+    JOIN tracks ON tracks.track_key = track_snapshots.track_key
+    JOIN artists ON artists.artist_key = tracks.artist_key
+    JOIN artist_snapshots ON artist_snapshots.artist_key = tracks.artist_key
+        AND artist_snapshots.query_date = track_snapshots.query_date
+    JOIN albums ON albums.album_key = track_snapshots.album_key;
+    """,
+    # 11: case and accent insensitive artist search; exact and prefix matches use the
+    # search_name index, fuzzy suggestions the trigram index artist_search.
+    """
+    ALTER TABLE artists ADD COLUMN search_name VARCHAR(255) NOT NULL DEFAULT '';
+    UPDATE artists SET search_name = fold_name(artist_name);
+    CREATE INDEX artists_search_name ON artists (search_name);
+    CREATE VIRTUAL TABLE artist_search USING fts5(
+        search_name, content='artists', content_rowid='artist_key', tokenize='trigram'
+    );
+    INSERT INTO artist_search (artist_search) VALUES ('rebuild');
+    CREATE TRIGGER artists_search_insert AFTER INSERT ON artists BEGIN
+        INSERT INTO artist_search (rowid, search_name) VALUES (new.artist_key, new.search_name);
+    END;
+    CREATE TRIGGER artists_search_update AFTER UPDATE OF search_name ON artists BEGIN
+        INSERT INTO artist_search (artist_search, rowid, search_name) VALUES ('delete', old.artist_key, old.search_name);
+        INSERT INTO artist_search (rowid, search_name) VALUES (new.artist_key, new.search_name);
+    END;
+    """,
+    # 12: newest snapshot of each artist per market, not only of the newest market exported;
+    # the artist data is read from the newest of them.
+    """
+    CREATE INDEX latest_snapshot_id_artist_date ON latest_snapshot (id_artist, query_date);
+    DELETE FROM latest_snapshot;
+    INSERT INTO latest_snapshot
+    SELECT id, id_artist, query_date, artist_name, followers, artist_popularity, name_song, song_popularity,
+        release_date, album_name, total_tracks, market
+    FROM (
+        SELECT *, MAX(query_date) OVER (PARTITION BY id_artist, market) AS latest_date FROM artists_data
+    )
+    WHERE query_date = latest_date;
+    """,
+]
+
+# Migrations that copy artists_data to new tables and drop the old ones.
+REWRITING_MIGRATIONS = {10}
+# A process opening the database waits this long (ms) for another one migrating it.
+MIGRATION_BUSY_TIMEOUT = 600000
+
+def split_statements(script: str):
+    """Yield the statements of a SQL script one by one (triggers included)."""
+    statement = ""
+
+    for piece in script.split(";"):
+        statement += piece + ";"
+        if sqlite3.complete_statement(statement):
+            if statement.strip(" \t\r\n;"):
+                yield statement
+            statement = ""
+
+# Rows of artists_data (in COLUMNS order) are staged in a temporary table and
+# spread over the normalized tables. Dimensions are shared, so only new names
+# are added; an artist keeps the name of its newest snapshot and the artist
+# snapshot of a day is the first one written. The last statement inserts the
+# track snapshots (ignoring the duplicates) and its rowcount is the number of
+# new rows.
+INSERT_ROWS_STATEMENTS = [
+    """
+    INSERT INTO artists (id_artist, artist_name, search_name)
+    SELECT id_artist, artist_name, fold_name(artist_name) FROM (
+        SELECT id_artist, artist_name, MAX(query_date) AS query_date FROM staged_rows GROUP BY id_artist, artist_name
+    ) ORDER BY query_date
+    ON CONFLICT (id_artist) DO UPDATE SET artist_name = excluded.artist_name, search_name = excluded.search_name
+    WHERE artist_name != excluded.artist_name;
+    """,
+    """
+    INSERT OR IGNORE INTO albums (album_name, release_date, total_tracks)
+    SELECT album_name, release_date, total_tracks FROM staged_rows ORDER BY position;
+    """,
+    """
+    INSERT OR IGNORE INTO tracks (artist_key, name_song)
+    SELECT artists.artist_key, staged.name_song
+    FROM staged_rows AS staged JOIN artists ON artists.id_artist = staged.id_artist
+    ORDER BY staged.position;
+    """,
+    """
+    INSERT OR IGNORE INTO artist_snapshots (artist_key, query_date, followers, artist_popularity)
+    SELECT artists.artist_key, staged.query_date, staged.followers, staged.artist_popularity
+    FROM staged_rows AS staged JOIN artists ON artists.id_artist = staged.id_artist
+    ORDER BY staged.position;
+    """,
+    """
+    INSERT OR IGNORE INTO track_snapshots (track_key, query_date, market, album_key, song_popularity)
+    SELECT tracks.track_key, staged.query_date, staged.market, albums.album_key, staged.song_popularity
+    FROM staged_rows AS staged
+    JOIN artists ON artists.id_artist = staged.id_artist
+    JOIN tracks ON tracks.artist_key = artists.artist_key AND tracks.name_song = staged.name_song
+    JOIN albums ON albums.album_name = staged.album_name AND albums.release_date = staged.release_date
+        AND albums.total_tracks = staged.total_tracks
+    ORDER BY staged.position;
+    """
+]
+
+# Derived tables refreshed after new rows, by exports and by the benchmarks history.
+# The latest snapshot of a (id_artist, market) is replaced by the given query_date
+# unless a newer one is already stored.
+REFRESH_LATEST_SNAPSHOT_STATEMENTS = [
+    """
+    DELETE FROM latest_snapshot WHERE id_artist = ?1 AND market = ?2 AND query_date <= ?3;
+    """,
+    """
+    INSERT INTO latest_snapshot
+    SELECT * FROM artists_data
+    WHERE id_artist = ?1 AND market = ?2 AND query_date = ?3
+    AND NOT EXISTS (
+        SELECT 1 FROM latest_snapshot WHERE id_artist = ?1 AND market = ?2 AND query_date > ?3
+    );
+    """
+]
+
+# Daily aggregates of a (id_artist, query_date), over every market.
+REFRESH_DAILY_STATS_STATEMENT = """
+    INSERT OR REPLACE INTO artist_daily_stats
+    SELECT id_artist, query_date, MAX(artist_name), MAX(followers), MAX(artist_popularity),
+        AVG(song_popularity), COUNT(DISTINCT name_song)
+    FROM artists_data
+    WHERE id_artist = ?1 AND query_date = ?2
+    GROUP BY id_artist, query_date;
+"""
+
+class ConnectToSQLite():
+    """Class to connect to SQLite database.
+
+    Connections are reused per thread and closed together by close_database
+    (or when leaving the with block).
+    
+    Methods:
+        check_path: Check if the path exists, if not, create it.
+        create_database: Create the database if not exists.
+        migrate_database: Apply the pending schema migrations.
+        insert_rows: Insert artists_data rows in the normalized tables and return the number of new rows.
+        database_path: Return the database file path, creating the database on first use.
+        connect_database: Return the connection of the current thread, opening it on first use.
+        close_database: Close every connection opened by this instance.
+    """
+    def __init__(self, base_path=os.path.join("src", "data_files"), pragmas=PRAGMAS):
+        self.base_path = base_path
+        self.database_name = "artists_data.db"
+        self.database_file = "sql_files"
+        self.pragmas = pragmas
+        self.full_path = None
+        self.migrated = False
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close_database()
+        
+    def check_path(self, paste:str) -> str:
+        path = os.path.join(self.base_path, paste)
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+            
+        return path
+    
+    def create_database(self) -> None:
+        path = self.check_path(self.database_file)
+        full_path = os.path.join(path, self.database_name)
+        conn = sqlite3.connect(full_path)
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE artists_data (
+                id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+                id_artist VARCHAR(255) NOT NULL,
+                query_date DATE NOT NULL,
+                artist_name VARCHAR(255) NOT NULL,
+                followers INTEGER NOT NULL,
+                artist_popularity INTEGER NOT NULL,
+                name_song VARCHAR(255) NOT NULL,
+                song_popularity INTEGER NOT NULL,
+                release_date DATE NOT NULL,
+                album_name VARCHAR(255) NOT NULL,
+                total_tracks INTEGER NOT NULL
+            );
+        """)
+        conn.commit()
+        conn.close()
+        
+    def database_path(self) -> str:
+        with self.lock:
+            if self.full_path is None:
+                path = self.check_path(self.database_file)
+                full_path = os.path.join(path, self.database_name)
+
+                if not os.path.exists(full_path):
+                    self.create_database()
+
+                self.full_path = full_path
+
+        return self.full_path
+        
+    def connect_database(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+
+        if conn is not None:
+            try:
+                conn.total_changes
+                return conn
+            except sqlite3.ProgrammingError:
+                with self.lock:
+                    self.connections.remove(conn)
+
+        conn = sqlite3.connect(self.database_path(), check_same_thread=False)
+        conn.create_function("normalize_name", 1, normalize_artist_name, deterministic=True)
+        conn.create_function("fold_name", 1, fold_artist_name, deterministic=True)
+
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+
+        # The connection is only kept once the schema is migrated, so a failed migration is retried.
+        try:
+            with self.lock:
+                if not self.migrated:
+                    self.migrate_database(conn)
+                    self.migrated = True
+                self.connections.append(conn)
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.close()
+            raise
+
+        self.local.conn = conn
+        
+        return conn
+
+    def close_database(self) -> None:
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+            self.local = threading.local()
+
+    def migrate_database(self, conn: sqlite3.Connection) -> None:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        conn.execute(f"PRAGMA busy_timeout = {MIGRATION_BUSY_TIMEOUT}")
+        rewritten = False
+
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            # Another process opening the database may have applied it while this one waited for the lock.
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != number - 1:
+                conn.commit()
+                continue
+
+            for statement in split_statements(script):
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+            rewritten = rewritten or number in REWRITING_MIGRATIONS
+
+        # Give back the space freed by the old tables (not needed on a new database).
+        if rewritten and version:
+            conn.execute("VACUUM")
+        conn.execute(f"PRAGMA busy_timeout = {self.pragmas.get('busy_timeout', 0)}")
+
+    def insert_rows(self, conn: sqlite3.Connection, rows) -> int:
+        conn.execute("""
+            CREATE TEMP TABLE IF NOT EXISTS staged_rows (
+                position INTEGER NOT NULL PRIMARY KEY,
+                id_artist VARCHAR(255),
+                query_date DATE,
+                artist_name VARCHAR(255),
+                followers INTEGER,
+                artist_popularity INTEGER,
+                name_song VARCHAR(255),
+                song_popularity INTEGER,
+                release_date DATE,
+                album_name VARCHAR(255),
+                total_tracks INTEGER,
+                market VARCHAR(2)
+            )
+        """)
+        conn.execute("DELETE FROM staged_rows")
+        conn.executemany(f"""
+            INSERT INTO staged_rows (id_artist, query_date, artist_name, followers, artist_popularity, name_song,
+                song_popularity, release_date, album_name, total_tracks, market)
+            VALUES ({", ".join("?" for _ in range(11))})
+        """, rows)
+
+        for statement in INSERT_ROWS_STATEMENTS:
+            cursor = conn.execute(statement)
+        conn.execute("DELETE FROM staged_rows")
+
+        return max(cursor.rowcount, 0)
+
+
+
+class QueryCache():
+    """Class to cache DataProvider results in memory (LRU with optional TTL).
+    
+    Methods:
+        get: Return the cached value of a key, or None when missing or expired.
+        set: Store the value of a key, evicting the least recently used when full.
+        stats: Return the hit and miss counters.
+    """
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or (self.ttl is not None and time.monotonic() > entry[1]):
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def set(self, key: str, value) -> None:
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self.lock:
+            self.entries[key] = (value, expires_at)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
+
+
+class RedisQueryCache():
+    """Class to cache DataProvider results in Redis, shared between processes.
+
+    The cache is best-effort: a Redis error counts as a miss (or a lost set)
+    and the lookup falls through to SQLite.
+    
+    Methods:
+        get: Return the cached value of a key, or None when missing or Redis fails.
+        set: Store the value of a key with the optional TTL, ignoring Redis errors.
+        stats: Return the hit, miss and error counters of this instance.
+    """
+    def __init__(self, client=None, url="redis://localhost:6379/0", ttl=3600, prefix="spotify-data:"):
+        try:
+            import redis
+            self.errors = redis.RedisError
+        except ImportError:
+            if client is None:
+                raise
+            # A client given without the redis package installed.
+            self.errors = OSError
+
+        self.client = client if client is not None else redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def get(self, key: str):
+        try:
+            data = self.client.get(self.prefix + key)
+        except self.errors:
+            self.failures += 1
+            data = None
+
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return json.loads(data)
+
+    def set(self, key: str, value) -> None:
+        try:
+            self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except self.errors:
+            self.failures += 1
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.failures}
+
+
+def cached_query(method):
+    """Serve the decorated DataProvider lookup from its cache, keyed on the data version, and time it."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.timer(f"query.{method.__name__}"):
+            if self.cache is None:
+                return method(self, *args, **kwargs)
+
+            args = tuple(arg if arg is None or isinstance(arg, (str, int, float)) else list(arg) for arg in args)
+            key = f"{self.cached_data_version()}:{method.__name__}:{json.dumps(args)}:{json.dumps(kwargs, sort_keys=True)}"
+            value = self.cache.get(key)
+
+            if value is None:
+                self.metrics.increment("cache.misses")
+                value = method(self, *args, **kwargs)
+                self.cache.set(key, value)
+            else:
+                self.metrics.increment("cache.hits")
+
+            return value
+
+    return wrapper
+
+
+# An artist is looked up by id or exact name, then by name ignoring case and
+# accents (searchArtists lists every match when several artists share it).
+RECENT_DATA_QUERY = """
+    SELECT * FROM latest_snapshot
+    WHERE id_artist = COALESCE((
+        SELECT id_artist FROM latest_snapshot
+        WHERE id_artist = ?1 OR artist_name = ?1
+        LIMIT 1
+    ), (
+        SELECT id_artist FROM artists
+        WHERE search_name = fold_name(?1)
+        LIMIT 1
+    ))
+    ORDER BY id;
+"""
+
+# The artist data of the newest day among the markets of the latest snapshot.
+RECENT_ARTIST_QUERY = RECENT_DATA_QUERY.replace("ORDER BY id;", "ORDER BY query_date DESC LIMIT 1;")
+
+RECENT_DATA_BY_ARTISTS_QUERY = """
+    SELECT lookup_keys.position, lookup_keys.artist, latest_snapshot.*
+    FROM lookup_keys
+    LEFT JOIN latest_snapshot ON latest_snapshot.id_artist = COALESCE((
+        SELECT id_artist FROM latest_snapshot
+        WHERE id_artist = lookup_keys.artist OR artist_name = lookup_keys.artist
+        LIMIT 1
+    ), (
+        SELECT id_artist FROM artists
+        WHERE search_name = fold_name(lookup_keys.artist)
+        LIMIT 1
+    ))
+    ORDER BY lookup_keys.position, latest_snapshot.id;
+"""
+
+ARTIST_ID_QUERY = """
+    SELECT COALESCE((
+        SELECT id_artist FROM latest_snapshot
+        WHERE id_artist = ?1 OR artist_name = ?1
+        LIMIT 1
+    ), (
+        SELECT id_artist FROM artists
+        WHERE search_name = fold_name(?1)
+        LIMIT 1
+    ));
+"""
+
+# Suggestions: names starting with the search (on the search_name index), then
+# names containing a piece of it (on the artist_search trigram index), re-ranked in Python.
+SEARCH_PREFIX_QUERY = """
+    SELECT artists.id_artist, artists.artist_name, artists.search_name,
+        (
+            SELECT followers FROM latest_snapshot WHERE id_artist = artists.id_artist
+            ORDER BY query_date DESC LIMIT 1
+        ) AS followers
+    FROM artists
+    WHERE search_name >= :search_name AND search_name < :search_name || char(1114111)
+    ORDER BY search_name
+    LIMIT :candidates;
+"""
+
+SEARCH_FUZZY_QUERY = """
+    SELECT artists.id_artist, artists.artist_name, artists.search_name,
+        (
+            SELECT followers FROM latest_snapshot WHERE id_artist = artists.id_artist
+            ORDER BY query_date DESC LIMIT 1
+        ) AS followers
+    FROM (
+        SELECT rowid FROM artist_search
+        WHERE artist_search MATCH :pieces
+        ORDER BY rank
+        LIMIT :candidates
+    ) AS matches
+    JOIN artists ON artists.artist_key = matches.rowid;
+"""
+
+# Deltas and rolling averages run over the whole history of the artist (so the
+# first day of the range is compared with the snapshot before it). Deltas, growth
+# and rank changes are since the previous snapshot, days_elapsed days before;
+# rolling averages cover the snapshots of the last :preceding + 1 days. The followers
+# rank among every artist is counted on the artist_daily_stats_date index,
+# only from the day before the range on.
+ARTIST_TRENDS_QUERY = """
+    WITH history AS (
+        SELECT query_date, artist_name,
+            CAST(julianday(query_date) - julianday(LAG(query_date) OVER days) AS INTEGER) AS days_elapsed,
+            followers,
+            followers - LAG(followers) OVER days AS followers_delta,
+            ROUND((followers - LAG(followers) OVER days) * 1.0 / LAG(followers) OVER days, 6) AS followers_growth,
+            ROUND(AVG(followers) OVER (days RANGE BETWEEN :preceding PRECEDING AND CURRENT ROW), 2) AS followers_rolling_avg,
+            artist_popularity,
+            artist_popularity - LAG(artist_popularity) OVER days AS popularity_delta,
+            ROUND(AVG(artist_popularity) OVER (days RANGE BETWEEN :preceding PRECEDING AND CURRENT ROW), 2) AS popularity_rolling_avg,
+            ROUND(avg_song_popularity, 2) AS avg_song_popularity
+        FROM artist_daily_stats
+        WHERE id_artist = :id_artist AND query_date <= :end_date
+        WINDOW days AS (ORDER BY julianday(query_date))
+    ),
+    ranked AS (
+        SELECT history.*, 1 + (
+            SELECT COUNT(*) FROM artist_daily_stats AS other
+            WHERE other.query_date = history.query_date AND other.followers > history.followers
+        ) AS followers_rank
+        FROM history
+        WHERE query_date >= COALESCE((
+            SELECT MAX(query_date) FROM history WHERE query_date < :start_date
+        ), :start_date)
+    ),
+    trends AS (
+        SELECT ranked.*, LAG(followers_rank) OVER (ORDER BY query_date) - followers_rank AS rank_change
+        FROM ranked
+    )
+    SELECT * FROM trends
+    WHERE query_date >= :start_date
+    ORDER BY query_date;
+"""
+
+TRACK_TRENDS_QUERY = """
+    WITH ranked_tracks AS (
+        SELECT query_date, market, name_song, song_popularity,
+            RANK() OVER (PARTITION BY query_date, market ORDER BY song_popularity DESC) AS popularity_rank
+        FROM track_snapshots JOIN tracks ON tracks.track_key = track_snapshots.track_key
+        WHERE tracks.artist_key = (SELECT artist_key FROM artists WHERE id_artist = :id_artist)
+        AND query_date <= :end_date AND (:market IS NULL OR market = :market)
+    ),
+    history AS (
+        SELECT query_date, market, name_song,
+            CAST(julianday(query_date) - julianday(LAG(query_date) OVER days) AS INTEGER) AS days_elapsed,
+            song_popularity,
+            song_popularity - LAG(song_popularity) OVER days AS popularity_delta,
+            ROUND(AVG(song_popularity) OVER (days RANGE BETWEEN :preceding PRECEDING AND CURRENT ROW), 2) AS popularity_rolling_avg,
+            popularity_rank,
+            LAG(popularity_rank) OVER days - popularity_rank AS rank_change
+        FROM ranked_tracks
+        WINDOW days AS (PARTITION BY market, name_song ORDER BY julianday(query_date))
+    )
+    SELECT * FROM history
+    WHERE query_date >= :start_date
+    ORDER BY query_date, market, popularity_rank, name_song;
+"""
+
+class DataProvider():
+    """Class to query data from SQLite database.
+
+    Only the standard library is imported here, so lookups start fast; the
+    DataExporter source (pandas, requests) is built on first access. With a
+    cache (QueryCache or RedisQueryCache), the get* lookups are served from it
+    until an export bumps the data version, read again at most every
+    version_recheck seconds (at once after a write on the same connection).
+    Every get* lookup is timed in metrics.
+    
+    Methods:
+        getRecentDataByArtist: Return the most recent data from an artist.
+        getRecentTopTracksDataByArtist: Return the most recent top tracks data from an artist (in every market, or in one).
+        getRecentDataByArtists: Return the most recent data from many artists (None when not found).
+        getRecentTopTracksDataByArtists: Return the most recent top tracks data from many artists (None when not found).
+        iterRecentDataByArtists: Yield the most recent data of each artist, in input order.
+        iterRecentTopTracksDataByArtists: Yield the most recent top tracks data of each artist, in input order.
+        iterRecentRowsByArtists: Yield the latest snapshot rows of each artist from a single query.
+        searchArtists: Return the artists matching a name ignoring case and accents: exact, prefix, then fuzzy suggestions.
+        getArtistTrends: Return the followers and popularity deltas and growth since the previous snapshot, rolling averages over days and rank of an artist.
+        getTrackTrends: Return the popularity deltas since the previous snapshot, rolling averages over days and rank of the top tracks of an artist, per market.
+        trends: Run a trend query for an artist over a date range.
+        data_version: Return the data version bumped by every export.
+        cached_data_version: Return the data version, read again only when stale.
+    """
+    def __init__(self, source=None, conn=None, cache=None, metrics=None, version_recheck=DATA_VERSION_RECHECK):
+        self.exporter = source
+        self.conn = conn if conn is not None else ConnectToSQLite()
+        self.cache = cache
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.version_recheck = version_recheck
+        # (version, connection, its total_changes, checked at), replaced at once so threads can share it.
+        self.version_state = None
+
+    @property
+    def source(self):
+        if self.exporter is None:
+            from src.data_exporter import DataExporter
+            self.exporter = DataExporter(conn=self.conn, metrics=self.metrics)
+
+        return self.exporter
+
+    def data_version(self) -> int:
+        cursor = self.conn.connect_database().cursor()
+        cursor.execute("SELECT version FROM data_version WHERE id = 1")
+
+        return cursor.fetchone()[0]
+
+    def cached_data_version(self) -> int:
+        conn = self.conn.connect_database()
+        state = self.version_state
+        now = time.monotonic()
+
+        if (state is None or state[1] is not conn or state[2] != conn.total_changes
+                or now - state[3] >= self.version_recheck):
+            state = (self.data_version(), conn, conn.total_changes, now)
+            self.version_state = state
+
+        return state[0]
+
+    def artist_data(self, data: tuple) -> dict:
+        return {
+            "id_artist": data[1],
+            "query_date": data[2],
+            "artist_name": data[3],
+            "followers": data[4],
+            "artist_popularity": data[5]
+        }
+
+    def track_data(self, track: tuple) -> dict:
+        return {
+            "id_artist": track[1],
+            "query_date": track[2],
+            "name_song": track[6],
+            "song_popularity": track[7],
+            "release_date": track[8],
+            "album_name": track[9],
+            "total_tracks": track[10],
+            "market": track[11]
+        }
+    
+    @cached_query
+    def getRecentDataByArtist(self, artist: str) -> dict:
+        conn = self.conn.connect_database()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(RECENT_ARTIST_QUERY, (artist,))
+            data = cursor.fetchone()
+            
+            if data:
+                dict_result = self.artist_data(data)
+            else:
+                raise ValueError("Artist not found.")
+            
+            dict_result = {artist: dict_result}
+            
+            return dict_result
+    
+    @cached_query
+    def getRecentTopTracksDataByArtist(self, artist: str, market=None) -> list:
+        conn = self.conn.connect_database()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(RECENT_DATA_QUERY, (artist,))
+            data = cursor.fetchall()
+
+            if data:
+                tracks_data = [self.track_data(track) for track in data if market is None or track[11] == market]
+            else:
+                raise ValueError("Artist not found.")
+
+            dict_result = {artist: tracks_data}
+            
+            return dict_result
+
+    def iterRecentRowsByArtists(self, artists):
+        conn = self.conn.connect_database()
+        with conn:
+            conn.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS lookup_keys (
+                    position INTEGER NOT NULL PRIMARY KEY,
+                    artist VARCHAR(255) NOT NULL
+                )
+            """)
+            conn.execute("DELETE FROM lookup_keys")
+            conn.executemany("INSERT INTO lookup_keys (artist) VALUES (?)", ((artist,) for artist in artists))
+
+        cursor = conn.cursor()
+        cursor.execute(RECENT_DATA_BY_ARTISTS_QUERY)
+
+        for _, group in itertools.groupby(cursor, key=lambda row: row[0]):
+            rows = list(group)
+            yield rows[0][1], [row[2:] for row in rows if row[2] is not None]
+
+    def iterRecentDataByArtists(self, artists):
+        for artist, rows in self.iterRecentRowsByArtists(artists):
+            # The markets of the latest snapshot may not all be from the same day.
+            yield {artist: self.artist_data(max(rows, key=lambda row: row[2])) if rows else None}
+
+    def iterRecentTopTracksDataByArtists(self, artists, market=None):
+        for artist, rows in self.iterRecentRowsByArtists(artists):
+            tracks = [self.track_data(track) for track in rows if market is None or track[11] == market]
+            yield {artist: tracks if rows else None}
+
+    @cached_query
+    def getRecentDataByArtists(self, artists) -> dict:
+        dict_result = {}
+        for result in self.iterRecentDataByArtists(artists):
+            dict_result.update(result)
+
+        return dict_result
+
+    @cached_query
+    def getRecentTopTracksDataByArtists(self, artists, market=None) -> dict:
+        dict_result = {}
+        for result in self.iterRecentTopTracksDataByArtists(artists, market):
+            dict_result.update(result)
+
+        return dict_result
+
+    def trends(self, query: str, artist: str, start_date=None, end_date=None, window=7, market=None) -> list:
+        conn = self.conn.connect_database()
+        cursor = conn.cursor()
+        cursor.execute(ARTIST_ID_QUERY, (artist,))
+        id_artist = cursor.fetchone()[0]
+
+        if id_artist is None:
+            raise ValueError("Artist not found.")
+
+        cursor.execute(query, {
+            "id_artist": id_artist,
+            "start_date": start_date or "0000-01-01",
+            "end_date": end_date or "9999-12-31",
+            "preceding": max(window, 1) - 1,
+            "market": market
+        })
+        columns = [column[0] for column in cursor.description]
+
+        return [dict(zip(columns, row)) for row in cursor]
+
+    @cached_query
+    def searchArtists(self, text: str, limit=10) -> dict:
+        search_name = fold_artist_name(text)
+        conn = self.conn.connect_database()
+        cursor = conn.cursor()
+        cursor.execute(SEARCH_PREFIX_QUERY, {"search_name": search_name, "candidates": limit * SEARCH_CANDIDATES})
+        prefix = sorted(cursor, key=lambda row: (row[2] != search_name, -(row[3] or 0)))
+        suggestions = [self.suggestion(row, "exact" if row[2] == search_name else "prefix") for row in prefix]
+
+        # Fuzzy suggestions only when nothing starts with the search; trigram
+        # phrases need 3 characters, so shorter searches only match by prefix.
+        if not suggestions and len(search_name) >= 3:
+            from difflib import SequenceMatcher
+
+            parts = max(1, min(SEARCH_PIECES, len(search_name) // 4))
+            size = len(search_name) / parts
+            pieces = [search_name[round(i * size):round((i + 1) * size)] for i in range(parts)]
+            cursor.execute(SEARCH_FUZZY_QUERY, {
+                "pieces": " OR ".join('"{}"'.format(piece.replace('"', '""')) for piece in pieces),
+                "candidates": limit * SEARCH_CANDIDATES
+            })
+            matcher = SequenceMatcher(None)
+            matcher.set_seq2(search_name)
+            scored = []
+            for row in cursor:
+                matcher.set_seq1(row[2])
+                if matcher.real_quick_ratio() >= SEARCH_CUTOFF and matcher.quick_ratio() >= SEARCH_CUTOFF:
+                    score = matcher.ratio()
+                    if score >= SEARCH_CUTOFF:
+                        scored.append((score, row))
+            scored.sort(key=lambda item: (-item[0], -(item[1][3] or 0)))
+            suggestions = [self.suggestion(row, "fuzzy", score) for score, row in scored]
+
+        return {text: suggestions[:limit]}
+
+    def suggestion(self, row: tuple, match: str, score=1.0) -> dict:
+        return {
+            "id_artist": row[0],
+            "artist_name": row[1],
+            "followers": row[3],
+            "match": match,
+            "score": round(score, 3)
+        }
+
+    @cached_query
+    def getArtistTrends(self, artist: str, start_date=None, end_date=None, window=7) -> dict:
+        return {artist: self.trends(ARTIST_TRENDS_QUERY, artist, start_date, end_date, window)}
+
+    @cached_query
+    def getTrackTrends(self, artist: str, start_date=None, end_date=None, window=7, market=None) -> dict:
+        return {artist: self.trends(TRACK_TRENDS_QUERY, artist, start_date, end_date, window, market)}
@@ -0,0 +1,121 @@
+import bisect
+import json
+import os
+import threading
+import time
+
+# Upper bounds (in milliseconds) of the latency histogram buckets.
+BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+class Timer():
+    """Context manager that records the elapsed time of its block in Metrics."""
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.metrics.observe(self.name, time.perf_counter() - self.start_time)
+
+
+class Histogram():
+    """Class to aggregate latencies in fixed buckets, so the memory does not grow with the samples.
+
+    Methods:
+        observe: Add a latency in seconds.
+        percentile: Return the upper bound (ms) of the bucket holding the given percentile.
+        report: Return the count, total, mean, min, max, percentiles and buckets.
+    """
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, percent: float) -> float:
+        rank = self.count * percent / 100
+        seen = 0
+
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, round(self.max * 1000, 3))
+
+        return round(self.max * 1000, 3)
+
+    def report(self) -> dict:
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 6),
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "min_ms": round(self.min * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": self.percentile(50),
+            "p95_ms": self.percentile(95),
+            "p99_ms": self.percentile(99),
+            "buckets_ms": {
+                f"le_{bound}" if bound is not None else "inf": count
+                for bound, count in zip(BUCKETS_MS + [None], self.counts) if count
+            }
+        }
+
+
+class Metrics():
+    """Class to collect counters and latency histograms of a run (thread-safe).
+
+    Every event is a dict update under a lock, cheap enough to stay on in production.
+
+    Methods:
+        increment: Add a value to a counter.
+        observe: Add a latency in seconds to a histogram.
+        timer: Return a context manager that observes the time spent in its block.
+        report: Return the counters and histograms as a JSON serializable dict.
+        write: Write the report to a JSON file.
+    """
+    def __init__(self):
+        self.started_at = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def increment(self, name: str, value=1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name: str) -> Timer:
+        return Timer(self, name)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed_s": round(time.time() - self.started_at, 6),
+                "counters": dict(sorted(self.counters.items())),
+                "timers": {name: histogram.report() for name, histogram in sorted(self.histograms.items())}
+            }
+
+    def write(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(path, "w", encoding="utf-8") as outfile:
+            json.dump(self.report(), outfile, indent=2)
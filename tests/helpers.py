@@ -0,0 +1,20 @@
+import pandas as pd
+
+ARTIST_ROW = {
+    "id_artist": "ID",
+    "query_date": "2023-12-15",
+    "artist_name": "AC/DC",
+    "followers": 10,
+    "artist_popularity": 80,
+    "name_song": ["TNT"],
+    "song_popularity": 70,
+    "release_date": "1975",
+    "album_name": "T.N.T.",
+    "total_tracks": 9,
+    "market": "BR"
+}
+
+
+def artists_frame(**columns) -> pd.DataFrame:
+    """Return artists_data rows of AC/DC, one per song, with the given columns overridden."""
+    return pd.DataFrame({**ARTIST_ROW, **columns})
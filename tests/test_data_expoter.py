@@ -1,18 +1,85 @@
 import unittest
-from unittest.mock import patch
-from src.data_exporter import ConsumeAPI, ConnectToSQLite, DataExporter, DataProvider
+from unittest.mock import patch, MagicMock
+from src.data_exporter import TokenManager, RateLimiter, ConsumeAPI, ConnectToSQLite, ArtistIdCache, DataExporter, COLUMNS
+from src.data_exporter import ExportJournal, SpotifyRequestError, ArtistNotFoundError, ResponseCache
+from src.data_exporter import DataAlreadyExistsError
+import pandas as pd
+from tests.helpers import artists_frame
+from requests import exceptions
 import os
+import io
+import json
+import tempfile
+import sqlite3
+import time
+from benchmarks.fake_spotify import FakeSpotifyServer, artist_id as fake_artist_id
+
+class TestTokenManager(unittest.TestCase):
+    def test_get_token_is_cached(self):
+        request_token = MagicMock(return_value=('TEST', 3600))
+        manager = TokenManager(request_token)
+        self.assertEqual(manager.get_token(), 'TEST')
+        self.assertEqual(manager.get_token(), 'TEST')
+        request_token.assert_called_once()
+
+    def test_get_token_refresh_before_expiry(self):
+        request_token = MagicMock(side_effect=[('OLD', 30), ('NEW', 3600)])
+        manager = TokenManager(request_token, refresh_margin=60)
+        self.assertEqual(manager.get_token(), 'OLD')
+        self.assertEqual(manager.get_token(), 'NEW')
+        self.assertEqual(request_token.call_count, 2)
+
+    def test_invalidate(self):
+        request_token = MagicMock(return_value=('TEST', 3600))
+        manager = TokenManager(request_token)
+        manager.get_token()
+        manager.invalidate()
+        self.assertFalse(manager.is_valid())
+        manager.get_token()
+        self.assertEqual(request_token.call_count, 2)
+
+    def test_token_is_reused_from_disk(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_path = os.path.join(tmpdir, 'token.json')
+            TokenManager(MagicMock(return_value=('TEST', 3600)), cache_path).get_token()
+            request_token = MagicMock()
+            manager = TokenManager(request_token, cache_path)
+            self.assertEqual(manager.get_token(), 'TEST')
+            request_token.assert_not_called()
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_acquire_within_capacity(self):
+        limiter = RateLimiter(rate=1000, capacity=5)
+        start = time.monotonic()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+
+    def test_acquire_waits_for_refill(self):
+        limiter = RateLimiter(rate=20, capacity=1)
+        limiter.acquire()
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+
+    def test_pause(self):
+        limiter = RateLimiter(rate=1000)
+        limiter.pause(0.1)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
 
 class TestConsumeAPI(unittest.TestCase):
-    @patch('src.data_exporter.pd.DataFrame')
     @patch('src.data_exporter.load_dotenv')
-    def test_init(self, mock_load_dotenv, mock_pd):
-        ConsumeAPI()
+    def test_init(self, mock_load_dotenv):
+        consumeapi = ConsumeAPI()
         mock_load_dotenv.assert_called_once()
-        mock_pd.assert_called_once()
+        self.assertEqual(list(consumeapi.records), COLUMNS)
     
     @patch('src.data_exporter.json.loads')
-    @patch('src.data_exporter.post')
+    @patch('src.data_exporter.Session.post')
     @patch('src.data_exporter.base64.b64encode')
     def test_get_token(self, mock_b64encode, mock_post, mock_json):
         mock_b64encode.return_value = b'TEST'
@@ -23,7 +90,7 @@ class TestConsumeAPI(unittest.TestCase):
         mock_json.assert_called_once()
     
     @patch('src.data_exporter.json.loads')
-    @patch('src.data_exporter.post')
+    @patch('src.data_exporter.Session.post')
     @patch('src.data_exporter.base64.b64encode')
     def test_get_token_raise_exception(self, mock_b64encode, mock_post, mock_json):
         mock_post.side_effect = Exception
@@ -31,6 +98,14 @@ class TestConsumeAPI(unittest.TestCase):
             consumeapi = ConsumeAPI()
             consumeapi.get_token()
         
+    @patch('src.data_exporter.ConsumeAPI.request_token')
+    def test_get_token_is_cached(self, mock_request_token):
+        mock_request_token.return_value = ('TEST', 3600)
+        consumeapi = ConsumeAPI()
+        consumeapi.get_token()
+        consumeapi.get_token()
+        mock_request_token.assert_called_once()
+
     @patch('src.data_exporter.ConsumeAPI.get_token')
     def test_get_auth_header(self, mock_get_token):
         mock_get_token.return_value = 'TEST'
@@ -39,8 +114,50 @@ class TestConsumeAPI(unittest.TestCase):
         mock_get_token.assert_called_once()
         self.assertIsInstance(consumeapi.get_auth_header(), dict)
         
+    @patch('src.data_exporter.ConsumeAPI.request_token')
+    @patch('src.data_exporter.Session.get')
+    @patch('src.data_exporter.json.loads')
+    def test_get_json_refresh_token_on_401(self, mock_json, mock_get, mock_request_token):
+        mock_request_token.side_effect = [('OLD', 3600), ('NEW', 3600)]
+        mock_get.side_effect = [MagicMock(status_code=401), MagicMock(status_code=200)]
+        consumeapi = ConsumeAPI()
+        consumeapi.get_json('TEST')
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs['headers'], {"Authorization": "Bearer NEW"})
+        mock_json.assert_called_once()
+
     @patch('src.data_exporter.ConsumeAPI.get_auth_header')
-    @patch('src.data_exporter.get')
+    @patch('src.data_exporter.Session.get')
+    @patch('src.data_exporter.json.loads')
+    def test_get_json_wait_on_429(self, mock_json, mock_get, mock_get_auth_header):
+        mock_get.side_effect = [MagicMock(status_code=429, headers={"Retry-After": "2"}), MagicMock(status_code=200)]
+        rate_limiter = MagicMock()
+        consumeapi = ConsumeAPI(rate_limiter=rate_limiter)
+        consumeapi.get_json('TEST')
+        rate_limiter.pause.assert_called_once_with(2.0)
+        self.assertEqual(rate_limiter.acquire.call_count, 2)
+        mock_json.assert_called_once()
+
+    def test_retry_after(self):
+        consumeapi = ConsumeAPI()
+        with patch('src.data_exporter.time.time', return_value=1445412480.0):
+            for headers, delay in (({}, 1.0), ({"Retry-After": "2.5"}, 2.5), ({"Retry-After": "-3"}, 0.0),
+                                   ({"Retry-After": "Wed, 21 Oct 2015 07:28:10 GMT"}, 10.0),
+                                   ({"Retry-After": "Wed, 21 Oct 2015 07:27:00 GMT"}, 0.0),
+                                   ({"Retry-After": "soon"}, 1.0)):
+                self.assertEqual(consumeapi.retry_after(headers), delay, headers)
+
+    @patch('src.data_exporter.ConsumeAPI.get_auth_header')
+    @patch('src.data_exporter.Session.get')
+    def test_malformed_response_fails_the_request(self, mock_get, mock_get_auth_header):
+        consumeapi = ConsumeAPI(artist_retries=0)
+        for content in (b'<html>Bad Gateway</html>', b'{"error": "oops"}', b'{"artists": null}'):
+            mock_get.return_value = MagicMock(status_code=200, content=content)
+            self.assertIsInstance(consumeapi.fetch_with_retry(consumeapi.search_for_artist, 'AC/DC'), SpotifyRequestError)
+            self.assertIsInstance(consumeapi.fetch_with_retry(consumeapi.get_songs_by_artist, 'ID'), SpotifyRequestError)
+
+    @patch('src.data_exporter.ConsumeAPI.get_auth_header')
+    @patch('src.data_exporter.Session.get')
     @patch('src.data_exporter.json.loads')
     def test_search_for_artist(self, mock_json, mock_get, mock_get_auth_header):
         mock_get_auth_header.return_value = 'TEST'
@@ -51,7 +168,7 @@ class TestConsumeAPI(unittest.TestCase):
         mock_json.assert_called_once()
         
     @patch('src.data_exporter.ConsumeAPI.get_auth_header')
-    @patch('src.data_exporter.get')
+    @patch('src.data_exporter.Session.get')
     @patch('src.data_exporter.json.loads')
     def test_search_for_artist_raise_exception(self, mock_json, mock_get, mock_get_auth_header):
         mock_get.side_effect = Exception
@@ -60,7 +177,7 @@ class TestConsumeAPI(unittest.TestCase):
             consumeapi.search_for_artist('TESTE')
         
     @patch('src.data_exporter.ConsumeAPI.get_auth_header')
-    @patch('src.data_exporter.get')
+    @patch('src.data_exporter.Session.get')
     @patch('src.data_exporter.json.loads')
     def test_get_artist_info(self, mock_json, mock_get, mock_get_auth_header):
         mock_get_auth_header.return_value = 'TEST'
@@ -71,7 +188,7 @@ class TestConsumeAPI(unittest.TestCase):
         mock_json.assert_called_once()
         
     @patch('src.data_exporter.ConsumeAPI.get_auth_header')
-    @patch('src.data_exporter.get')
+    @patch('src.data_exporter.Session.get')
     @patch('src.data_exporter.json.loads')
     def test_get_artist_info(self, mock_json, mock_get, mock_get_auth_header):
         mock_get.side_effect = Exception
@@ -80,7 +197,7 @@ class TestConsumeAPI(unittest.TestCase):
             consumeapi.get_artist_info('TESTE')
     
     @patch('src.data_exporter.ConsumeAPI.get_auth_header')
-    @patch('src.data_exporter.get')
+    @patch('src.data_exporter.Session.get')
     @patch('src.data_exporter.json.loads')
     def testget_songs_by_artist(self, mock_json, mock_get, mock_get_auth_header):
         mock_get_auth_header.return_value = 'TEST'
@@ -90,15 +207,193 @@ class TestConsumeAPI(unittest.TestCase):
         mock_get.assert_called_once()
         mock_json.assert_called_once()
         
+    @patch('src.data_exporter.ConsumeAPI.get_auth_header')
+    @patch('src.data_exporter.Session.get')
+    @patch('src.data_exporter.json.loads')
+    def test_get_several_artists_info(self, mock_json, mock_get, mock_get_auth_header):
+        consumeapi = ConsumeAPI()
+        consumeapi.get_several_artists_info(['A', 'B'])
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.kwargs['params'], {"ids": "A,B"})
+        mock_json.assert_called_once()
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    def test_resolve_artists_ids_skip_cached(self, mock_search_for_artist):
+        mock_search_for_artist.return_value = 'NEW'
+        id_cache = MagicMock()
+        id_cache.get.side_effect = lambda name: 'CACHED' if name == 'Fresno' else None
+        consumeapi = ConsumeAPI()
+        artists_ids = consumeapi.resolve_artists_ids(['Fresno', 'AC/DC'], MagicMock(map=map), id_cache)
+        self.assertEqual(artists_ids, ['CACHED', 'NEW'])
+        mock_search_for_artist.assert_called_once_with('AC/DC')
+        id_cache.update.assert_called_once_with({'AC/DC': 'NEW'})
+
     @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
     @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
-    def test_get_songs_by_artists(self, mock_dataframe_builder, mock_search_for_artist):
+    def test_get_songs_by_artists(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_several_artists_info, mock_search_for_artist):
         mock_search_for_artist.return_value = 'TEST'
+        mock_get_several_artists_info.return_value = [{"id": "TEST"}]
         consumeapi = ConsumeAPI()
         consumeapi.get_songs_by_artists(['TEST'])
         mock_search_for_artist.assert_called_once()
+        mock_get_several_artists_info.assert_called_once()
+        mock_get_songs_by_artist.assert_called_once()
         mock_dataframe_builder.assert_called_once()
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
+    def test_get_songs_by_artists_batch_and_order(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_several_artists_info, mock_search_for_artist):
+        def search_for_artist(artist_name):
+            time.sleep(0.05 if artist_name == '0' else 0)
+            return f"ID{artist_name}"
+        mock_search_for_artist.side_effect = search_for_artist
+        mock_get_several_artists_info.side_effect = lambda ids: [{"id": artist_id} for artist_id in ids]
+        names = [str(i) for i in range(120)]
+        consumeapi = ConsumeAPI(max_workers=4)
+        consumeapi.get_songs_by_artists(names)
+        self.assertEqual(mock_get_several_artists_info.call_count, 3)
+        built = [call.args[0] for call in mock_dataframe_builder.call_args_list]
+        infos = [call.args[1]["id"] for call in mock_dataframe_builder.call_args_list]
+        self.assertEqual(built, [f"ID{name}" for name in names])
+        self.assertEqual(infos, built)
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_artist_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
+    def test_get_songs_by_artists_match_info_by_id(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_artist_info, mock_get_several_artists_info, mock_search_for_artist):
+        mock_search_for_artist.side_effect = lambda artist_name: f"ID{artist_name}"
+        mock_get_several_artists_info.return_value = [{"id": "IDC"}, {"id": "IDA"}]
+        mock_get_artist_info.side_effect = lambda artist_id: {"id": artist_id}
+        consumeapi = ConsumeAPI()
+        consumeapi.get_songs_by_artists(['A', 'B', 'C'])
+        mock_get_artist_info.assert_called_once_with('IDB')
+        built = [(call.args[0], call.args[1]["id"]) for call in mock_dataframe_builder.call_args_list]
+        self.assertEqual(built, [('IDA', 'IDA'), ('IDB', 'IDB'), ('IDC', 'IDC')])
     
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
+    def test_get_songs_by_artists_fetch_each_artist_once(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_several_artists_info, mock_search_for_artist):
+        mock_search_for_artist.side_effect = lambda artist_name: "ID" + artist_name.lower()
+        mock_get_several_artists_info.side_effect = lambda ids: [{"id": artist_id} for artist_id in ids]
+        consumeapi = ConsumeAPI()
+        consumeapi.get_songs_by_artists(['AC/DC', 'AC/DC', 'ac/dc', 'Fresno'])
+        self.assertEqual(mock_search_for_artist.call_count, 3)
+        mock_get_several_artists_info.assert_called_once_with(['IDac/dc', 'IDfresno'])
+        self.assertEqual(mock_get_songs_by_artist.call_count, 2)
+        self.assertEqual([call.args[0] for call in mock_dataframe_builder.call_args_list], ['IDac/dc', 'IDfresno'])
+        failed = {}
+        mock_get_several_artists_info.side_effect = SpotifyRequestError('503 Service Unavailable')
+        ConsumeAPI(artist_retries=0).get_songs_by_artists(['AC/DC', 'ac/dc', 'AC/DC'], failed=failed)
+        self.assertEqual(failed, {'AC/DC': '503 Service Unavailable', 'ac/dc': '503 Service Unavailable'})
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    def test_get_songs_by_artists_markets(self, mock_get_songs_by_artist, mock_get_several_artists_info, mock_search_for_artist):
+        def get_songs_by_artist(artist_id, country="BR"):
+            if artist_id == 'IDFLAKY' and country == 'US':
+                raise SpotifyRequestError('404 Not Found')
+            return [{"name": f"{artist_id}-{country}", "popularity": 70,
+                     "album": {"release_date": "1975", "name": "ALBUM", "total_tracks": 9}}]
+        mock_search_for_artist.side_effect = lambda artist_name: f"ID{artist_name}"
+        mock_get_several_artists_info.side_effect = lambda ids: [
+            {"id": artist_id, "name": artist_id, "followers": {"total": 10}, "popularity": 80} for artist_id in ids
+        ]
+        mock_get_songs_by_artist.side_effect = get_songs_by_artist
+        consumeapi = ConsumeAPI(artist_retries=0, markets=['BR', 'US'])
+        failed = {}
+        df = consumeapi.get_songs_by_artists(['OK', 'FLAKY'], failed=failed)
+        mock_get_several_artists_info.assert_called_once_with(['IDOK', 'IDFLAKY'])
+        self.assertEqual(mock_get_songs_by_artist.call_count, 4)
+        self.assertEqual(failed, {'FLAKY': '404 Not Found'})
+        self.assertEqual(list(zip(df["name_song"], df["market"])), [('IDOK-BR', 'BR'), ('IDOK-US', 'US')])
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_artist_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
+    def test_get_songs_by_artists_missing_artist_info(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_artist_info, mock_get_several_artists_info, mock_search_for_artist):
+        def get_artist_info(artist_id):
+            if artist_id == 'IDGONE':
+                raise SpotifyRequestError('404 Not Found')
+            return {"id": artist_id}
+        mock_search_for_artist.side_effect = lambda artist_name: f"ID{artist_name}"
+        mock_get_several_artists_info.return_value = [{"id": "IDOK"}, None, None]
+        mock_get_artist_info.side_effect = get_artist_info
+        consumeapi = ConsumeAPI(artist_retries=2, retry_backoff=0, markets=['BR', 'US'])
+        failed = {}
+        consumeapi.get_songs_by_artists(['OK', 'NULL', 'GONE'], failed=failed)
+        fetched = [call.args[0] for call in mock_get_artist_info.call_args_list]
+        self.assertEqual(fetched.count('IDNULL'), 1)
+        self.assertEqual(fetched.count('IDGONE'), 3)
+        self.assertEqual(failed, {'GONE': '404 Not Found'})
+        built = [(call.args[0], call.args[1]["id"], call.args[3]) for call in mock_dataframe_builder.call_args_list]
+        self.assertEqual(built, [('IDOK', 'IDOK', 'BR'), ('IDOK', 'IDOK', 'US'), ('IDNULL', 'IDNULL', 'BR'), ('IDNULL', 'IDNULL', 'US')])
+
+    @patch('src.data_exporter.ConsumeAPI.search_for_artist')
+    @patch('src.data_exporter.ConsumeAPI.get_several_artists_info')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
+    @patch('src.data_exporter.ConsumeAPI.dataframe_builder')
+    def test_get_songs_by_artists_retry_and_record_failures(self, mock_dataframe_builder, mock_get_songs_by_artist, mock_get_several_artists_info, mock_search_for_artist):
+        def search_for_artist(artist_name):
+            if artist_name == 'BAD':
+                raise SpotifyRequestError('404 Not Found')
+            return f"ID{artist_name}"
+        flaky = iter([SpotifyRequestError('503 Service Unavailable')])
+        def get_songs_by_artist(artist_id, country="BR"):
+            if artist_id == 'IDFLAKY':
+                error = next(flaky, None)
+                if error:
+                    raise error
+            return []
+        mock_search_for_artist.side_effect = search_for_artist
+        mock_get_several_artists_info.side_effect = lambda ids: [{"id": artist_id} for artist_id in ids]
+        mock_get_songs_by_artist.side_effect = get_songs_by_artist
+        consumeapi = ConsumeAPI(artist_retries=2, retry_backoff=0)
+        failed = {}
+        consumeapi.get_songs_by_artists(['OK', 'BAD', 'FLAKY'], failed=failed)
+        self.assertEqual(failed, {'BAD': '404 Not Found'})
+        self.assertEqual(mock_search_for_artist.call_count, 5)
+        built = [call.args[0] for call in mock_dataframe_builder.call_args_list]
+        self.assertEqual(built, ['IDOK', 'IDFLAKY'])
+        with self.assertRaises(SystemExit):
+            consumeapi.get_songs_by_artists(['BAD'])
+
+    @patch('src.data_exporter.ConsumeAPI.get_json')
+    def test_search_for_artist_not_found(self, mock_get_json):
+        mock_get_json.return_value = {"artists": {"items": []}}
+        consumeapi = ConsumeAPI(retry_backoff=10)
+        failed = {}
+        self.assertEqual(len(consumeapi.get_songs_by_artists(['NOPE'], failed=failed)), 0)
+        self.assertEqual(failed, {'NOPE': "No artist found for 'NOPE'"})
+        mock_get_json.assert_called_once()
+
+    def test_session_pool_fits_the_workers(self):
+        adapter = ConsumeAPI(pool_size=4, max_workers=16).session.get_adapter("https://api.spotify.com")
+        self.assertEqual(adapter._pool_maxsize, 16)
+        adapter = ConsumeAPI(pool_size=32, max_workers=16).session.get_adapter("https://api.spotify.com")
+        self.assertEqual(adapter._pool_maxsize, 32)
+
+    @patch('src.data_exporter.time.sleep')
+    def test_fetch_with_retry_skip_client_errors(self, mock_sleep):
+        def http_error(status_code):
+            return SpotifyRequestError(exceptions.HTTPError(response=MagicMock(status_code=status_code)))
+        consumeapi = ConsumeAPI(artist_retries=3)
+        for status_code, calls in ((404, 1), (400, 1), (429, 4), (503, 4)):
+            method = MagicMock(side_effect=http_error(status_code))
+            self.assertIsInstance(consumeapi.fetch_with_retry(method, 'ID'), SpotifyRequestError)
+            self.assertEqual(method.call_count, calls, status_code)
+        self.assertFalse(consumeapi.retryable(ArtistNotFoundError('NOPE')))
+
     @patch('src.data_exporter.ConsumeAPI.get_artist_info')
     @patch('src.data_exporter.ConsumeAPI.get_songs_by_artist')
     def test_dataframe_builder(self, mock_get_songs_by_artist, mock_get_artist_info):
@@ -107,34 +402,158 @@ class TestConsumeAPI(unittest.TestCase):
         mock_get_artist_info.assert_called_once()
         mock_get_songs_by_artist.assert_called_once()
 
+    def test_build_dataframe(self):
+        artist_info = {"name": "AC/DC", "followers": {"total": 10}, "popularity": 80}
+        song = {"name": "TNT", "popularity": 70, "album": {"release_date": "1975", "name": "T.N.T.", "total_tracks": 9}}
+        consumeapi = ConsumeAPI()
+        consumeapi.dataframe_builder('ACDC', artist_info, [song, song])
+        df = consumeapi.build_dataframe()
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(len(df), 2)
+        self.assertEqual(str(df["followers"].dtype), "int64")
+        self.assertEqual(df["release_date"][0], "1975")
+        self.assertEqual(len(consumeapi.build_dataframe()), 0)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "http_cache", "responses.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key(self):
+        cache = ResponseCache(self.path)
+        self.assertEqual(cache.key('URL', {"q": "AC/DC", "limit": 1}), 'URL?limit=1&q=AC%2FDC')
+        self.assertEqual(cache.key('URL'), 'URL')
+        cache.close()
+
+    def test_max_age(self):
+        cache = ResponseCache(self.path, default_ttl=5)
+        self.assertEqual(cache.max_age({"Cache-Control": "public, max-age=7200"}), 7200)
+        self.assertEqual(cache.max_age({"Cache-Control": "no-cache"}), 0)
+        self.assertIsNone(cache.max_age({"Cache-Control": "private, no-store"}))
+        self.assertEqual(cache.max_age({}), 5)
+        cache.close()
+
+    def test_get_set_and_freshness(self):
+        cache = ResponseCache(self.path)
+        self.assertIsNone(cache.get('URL'))
+        cache.set('URL', b'{}', '"v1"', 60)
+        self.assertEqual(cache.get('URL'), (b'{}', '"v1"', True))
+        cache.set('URL', b'{}', '"v2"', 0)
+        self.assertEqual(cache.get('URL'), (b'{}', '"v2"', False))
+        cache.touch('URL', 60)
+        self.assertTrue(cache.get('URL')[2])
+        cache.close()
+        self.assertEqual(ResponseCache(self.path).get('URL')[1], '"v2"')
+
+    def test_evict_least_recently_used(self):
+        cache = ResponseCache(self.path, max_bytes=25)
+        with patch('src.data_exporter.time.time', side_effect=range(1000, 2000)):
+            cache.set('A', b'x' * 10)
+            cache.set('B', b'x' * 10)
+            cache.get('A')
+            cache.set('C', b'x' * 10)
+        self.assertIsNone(cache.get('B'))
+        self.assertIsNotNone(cache.get('A'))
+        self.assertEqual(cache.size, 20)
+        cache.close()
+
+    @patch('src.data_exporter.ConsumeAPI.get_auth_header')
+    @patch('src.data_exporter.Session.get')
+    def test_get_json_revalidate_with_etag(self, mock_get, mock_get_auth_header):
+        mock_get_auth_header.side_effect = lambda: {"Authorization": "Bearer TEST"}
+        mock_get.side_effect = [
+            MagicMock(status_code=200, content=b'{"tracks": [1]}', headers={"ETag": '"v1"', "Cache-Control": "max-age=0"}),
+            MagicMock(status_code=304, content=b'', headers={"Cache-Control": "max-age=60"})
+        ]
+        consumeapi = ConsumeAPI(response_cache=ResponseCache(self.path))
+        for _ in range(3):
+            self.assertEqual(consumeapi.get_json('URL', {"country": "BR"}), {"tracks": [1]})
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(mock_get.call_args.kwargs['headers']["If-None-Match"], '"v1"')
+        counters = consumeapi.metrics.report()["counters"]
+        self.assertEqual((counters["http.cache.revalidated"], counters["http.cache.hits"]), (1, 1))
+        consumeapi.response_cache.close()
+
+    @patch('src.data_exporter.Session.get')
+    def test_offline_serve_only_from_cache(self, mock_get):
+        cache = ResponseCache(self.path, offline=True)
+        cache.set('URL/artists/ID/top-tracks?country=BR', b'{"tracks": []}', None, 0)
+        consumeapi = ConsumeAPI(api_url='URL', response_cache=cache, retry_backoff=10)
+        self.assertEqual(consumeapi.get_songs_by_artist('ID'), [])
+        error = consumeapi.fetch_with_retry(consumeapi.get_songs_by_artist, 'OTHER')
+        self.assertIsInstance(error, SpotifyRequestError)
+        mock_get.assert_not_called()
+        cache.close()
+
+
+class TestConsumeAPIFakeServer(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSpotifyServer()
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_requests_reuse_one_connection(self):
+        consumeapi = ConsumeAPI(api_url=self.server.api_url, auth_url=self.server.auth_url)
+        artist_id = consumeapi.search_for_artist('AC/DC')
+        consumeapi.get_artist_info(artist_id)
+        consumeapi.get_songs_by_artist(artist_id)
+        self.assertEqual(artist_id, fake_artist_id('AC/DC'))
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_requests_are_measured(self):
+        consumeapi = ConsumeAPI(api_url=self.server.api_url, auth_url=self.server.auth_url)
+        artist_id = consumeapi.search_for_artist('AC/DC')
+        consumeapi.get_songs_by_artist(artist_id)
+        report = consumeapi.metrics.report()
+        self.assertGreaterEqual(report["counters"]["http.requests"], 2)
+        self.assertGreater(report["counters"]["http.bytes"], 0)
+        self.assertEqual(report["timers"]["api.search"]["count"], 1)
+        self.assertEqual(report["timers"]["api.top_tracks"]["count"], 1)
+
+
+class TestArtistIdCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_seed_from_artists_data(self):
+        self.database.create_database()
+        conn = sqlite3.connect(os.path.join(self.tmpdir.name, "sql_files", "artists_data.db"))
+        with conn:
+            conn.execute("""
+                INSERT INTO artists_data VALUES
+                (1, 'ID', '2023-12-15', 'Bring Me The Horizon', 1, 1, 'SONG', 1, '2023-01-01', 'ALBUM', 1)
+            """)
+        conn.close()
+        conn = self.database.connect_database()
+        self.assertEqual(ArtistIdCache(conn).get('bring me  the horizon'), 'ID')
+        conn.close()
+
+    def test_update_and_get(self):
+        conn = self.database.connect_database()
+        id_cache = ArtistIdCache(conn)
+        self.assertIsNone(id_cache.get('AC/DC'))
+        id_cache.update({'AC/DC': 'ID'})
+        self.assertEqual(id_cache.get('ac/dc'), 'ID')
+        conn.close()
+
+    def test_ttl_and_refresh(self):
+        conn = self.database.connect_database()
+        ArtistIdCache(conn).update({'AC/DC': 'ID'})
+        with patch('src.data_exporter.time.time', return_value=time.time() + 120):
+            self.assertIsNone(ArtistIdCache(conn, ttl=60).get('AC/DC'))
+        self.assertIsNone(ArtistIdCache(conn, refresh=True).get('AC/DC'))
+        conn.close()
 
-class TesteConnectToSQLite(unittest.TestCase):
-    def test_init(self):
-        conn = ConnectToSQLite()
-        self.assertEqual(conn.database_name, "artists_data.db")
-        self.assertEqual(conn.database_file, "sql_files")
-        
-    def test_check_path(self):
-        conn = ConnectToSQLite()
-        self.assertEqual(conn.check_path("sql_files"), os.path.join("src", "data_files", "sql_files"))
-        
-    @patch('src.data_exporter.sqlite3.connect')
-    def test_create_database(self, mock_connect):
-        conn = ConnectToSQLite()
-        conn.create_database()
-        mock_connect.assert_called_once()
-        
-    @patch('src.data_exporter.ConnectToSQLite.check_path')
-    @patch('src.data_exporter.os.path.join')
-    @patch('src.data_exporter.sqlite3.connect')
-    def teste_connect_database(self, mock_connect, mock_join, mock_check_path):
-        mock_check_path.return_value = 'TEST'
-        conn = ConnectToSQLite()
-        conn.connect_database()
-        mock_check_path.assert_called_once()
-        mock_join.assert_called_once()
-        mock_connect.assert_called_once()
-        
 
 class TestDataExporter(unittest.TestCase):
     def test_init(self):
@@ -142,50 +561,214 @@ class TestDataExporter(unittest.TestCase):
         self.assertIsInstance(exporter.source, ConsumeAPI)
         self.assertIsInstance(exporter.conn, ConnectToSQLite)
 
-    @patch('src.data_exporter.ConnectToSQLite.check_path')
-    @patch('src.data_exporter.open')
-    @patch('src.data_exporter.json.loads')
-    def test_import_artists_names(self, mock_json, mock_open, mock_check_path):
-        exporter = DataExporter()
-        exporter.import_artists_names()
-        mock_check_path.assert_called_once()
-        mock_open.assert_called_once()
-        mock_json.assert_called_once()
+    def test_import_artists_names(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch('src.data_exporter.ConnectToSQLite.check_path', return_value=tmpdir) as mock_check_path:
+                exporter = DataExporter()
+                self.assertIsNone(exporter.import_artists_names())
+                with open(os.path.join(tmpdir, 'names.json'), 'w', encoding='utf-8') as outfile:
+                    outfile.write('["AC/DC", "Fresno"]')
+                self.assertEqual(exporter.import_artists_names(), ['AC/DC', 'Fresno'])
+                mock_check_path.assert_called_with("artists_names")
         
-    @patch('src.data_exporter.DataExporter.import_artists_names')
+    @patch('src.data_exporter.DataExporter.iter_artists_names')
     @patch('src.data_exporter.ConsumeAPI.get_songs_by_artists')
     @patch('src.data_exporter.ConnectToSQLite.connect_database')
-    def test_export_data(self, mock_connect_database, mock_get_songs_by_artists, mock_import_artists_names):
+    @patch('src.data_exporter.DataExporter.insert_data_db')
+    @patch('src.data_exporter.DataExporter.export_sql_to_csv')
+    def test_export_data(self, mock_export_sql_to_csv, mock_insert_data_db, mock_connect_database, mock_get_songs_by_artists, mock_iter_artists_names):
+        mock_iter_artists_names.return_value = iter(['TEST'])
+        mock_insert_data_db.return_value = (10, 0)
         exporter = DataExporter()
         exporter.export_data()
-        mock_import_artists_names.assert_called_once()
+        mock_iter_artists_names.assert_called_once()
         mock_get_songs_by_artists.assert_called_once()
         mock_connect_database.assert_called_once()
+        mock_insert_data_db.assert_called_once()
+        mock_export_sql_to_csv.assert_called_once()
 
-
-class TestDataProvider(unittest.TestCase):
-    def test_init(self):
-        provider = DataProvider()
-        self.assertIsInstance(provider.source, DataExporter)
-        self.assertIsInstance(provider.conn, ConnectToSQLite)
-        
-    @patch('src.data_exporter.ConnectToSQLite.connect_database')
-    def test_getRecentDataByArtist(self, mock_connect_database):
-        mock_connect_database.cursor.execute.fatchone.return_value = 'TEST'
-        provider = DataProvider()
-        provider.getRecentDataByArtist('TESTE')
-        mock_connect_database.assert_called_once()
-    
-    @patch('src.data_exporter.ConnectToSQLite.connect_database')
-    def getRecentTopTracksDataByArtist(self, mock_connect_database):
-        mock_connect_database.cursor.execute.fatchone.return_value = 'TEST'
-        provider = DataProvider()
-        provider.getRecentTopTracksDataByArtist('TEST')
-        mock_connect_database.assert_called_once()
-        
+    @patch('src.data_exporter.DataExporter.iter_artists_names')
+    @patch('src.data_exporter.ConsumeAPI.get_songs_by_artists')
     @patch('src.data_exporter.ConnectToSQLite.connect_database')
-    def getRecentTopTracksDataByArtist_raise_exception(self, mock_connect_database):
-        mock_connect_database.cursor.execute.side_effect = Exception
-        with self.assertRaises(Exception):
-            provider = DataProvider()
-            provider.getRecentTopTracksDataByArtist('TEST')
+    @patch('src.data_exporter.DataExporter.insert_data_db')
+    @patch('src.data_exporter.DataExporter.export_sql_to_csv')
+    def test_export_data_in_chunks(self, mock_export_sql_to_csv, mock_insert_data_db, mock_connect_database, mock_get_songs_by_artists, mock_iter_artists_names):
+        mock_iter_artists_names.return_value = iter(['A', 'B', 'C', 'D', 'E'])
+        mock_insert_data_db.return_value = (10, 1)
+        exporter = DataExporter(chunk_size=2)
+        self.assertEqual(exporter.export_data(), (30, 3, {}))
+        chunks = [call.args[0] for call in mock_get_songs_by_artists.call_args_list]
+        self.assertEqual(chunks, [['A', 'B'], ['C', 'D'], ['E']])
+        self.assertEqual(mock_insert_data_db.call_count, 3)
+        mock_export_sql_to_csv.assert_called_once()
+
+    def test_iter_artists_names(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            files = {
+                'names.json': '[\n  "AC/DC",\n  "Grupo Menos \\u00e9 Mais", "Fresno",\n  "Os Paralamas do Sucesso"\n]',
+                'names.txt': 'AC/DC\n\nGrupo Menos é Mais\nFresno\nOs Paralamas do Sucesso\n',
+                'names.jsonl': '"AC/DC"\n"Grupo Menos é Mais"\n"Fresno"\n"Os Paralamas do Sucesso"\n'
+            }
+            for name, content in files.items():
+                path = os.path.join(tmpdir, name)
+                with open(path, 'w', encoding='utf-8') as outfile:
+                    outfile.write(content)
+                for buffer_size in (4, 65536):
+                    with patch('src.data_exporter.NAMES_BUFFER_SIZE', buffer_size):
+                        names = list(DataExporter(names_path=path).iter_artists_names())
+                    self.assertEqual(names, ['AC/DC', 'Grupo Menos é Mais', 'Fresno', 'Os Paralamas do Sucesso'], name)
+
+
+    def test_iter_json_array_strict_like_json_load(self):
+        contents = [
+            '[]', '  [ ]  ', '\n["AC/DC"]\n', '[ "a" , "b" ]', '["a,b", "c]", "\\"x"]', '[1, 12345, true, null, {"a": [1]}]',
+            '["AC/DC" "Fresno"]', '[,,"AC/DC",,]', '["a",]', '[,"a"]', '["a" ,, "b"]', '["a"', '["a"] x', '', '  ',
+            '{"a": 1}', '[x]', '[1 2]'
+        ]
+        for content in contents:
+            try:
+                expected = json.loads(content)
+            except json.JSONDecodeError:
+                expected = json.JSONDecodeError
+            # Only an array of names is accepted.
+            if not isinstance(expected, list):
+                expected = json.JSONDecodeError
+            for buffer_size in (1, 3, 65536):
+                with patch('src.data_exporter.NAMES_BUFFER_SIZE', buffer_size):
+                    try:
+                        result = list(DataExporter().iter_json_array(io.StringIO(content)))
+                    except json.JSONDecodeError:
+                        result = json.JSONDecodeError
+                self.assertEqual(result, expected, (content, buffer_size))
+
+    def test_iter_json_array_bounded_on_invalid_item(self):
+        infile = MagicMock()
+        infile.read.side_effect = lambda size: '["' if infile.read.call_count == 1 else 'a' * size
+        with patch('src.data_exporter.NAMES_MAX_ITEM_SIZE', 1000), patch('src.data_exporter.NAMES_BUFFER_SIZE', 100):
+            with self.assertRaises(json.JSONDecodeError):
+                list(DataExporter().iter_json_array(infile))
+        self.assertLess(infile.read.call_count, 15)
+
+
+class TestInsertDataDB(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.conn = ConnectToSQLite(base_path=self.tmpdir.name).connect_database()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def build_df(self, songs):
+        return artists_frame(name_song=songs)
+
+    def count_rows(self):
+        return self.conn.execute("SELECT COUNT(*) FROM artists_data").fetchone()[0]
+
+    def test_insert_new_rows(self):
+        exporter = DataExporter()
+        self.assertEqual(exporter.insert_data_db(self.conn, self.build_df(['A', 'B'])), (2, 0))
+        self.assertEqual(self.count_rows(), 2)
+
+    def test_duplicates_abort_the_insert(self):
+        exporter = DataExporter()
+        exporter.insert_data_db(self.conn, self.build_df(['A']))
+        with self.assertRaises(DataAlreadyExistsError):
+            exporter.insert_data_db(self.conn, self.build_df(['A', 'B']))
+        self.assertEqual(self.count_rows(), 1)
+
+    def test_rows_repeated_in_the_frame_are_not_duplicates(self):
+        exporter = DataExporter()
+        self.assertEqual(exporter.insert_data_db(self.conn, self.build_df(['A', 'B', 'A'])), (2, 0))
+        self.assertEqual(self.count_rows(), 2)
+
+    def test_skip_duplicates(self):
+        exporter = DataExporter(skip_duplicates=True)
+        exporter.insert_data_db(self.conn, self.build_df(['A']))
+        self.assertEqual(exporter.insert_data_db(self.conn, self.build_df(['A', 'B', 'B'])), (1, 2))
+        self.assertEqual(self.count_rows(), 2)
+
+
+class TestExportSqlToCsv(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+        self.conn = self.database.connect_database()
+        self.exporter = DataExporter(conn=self.database)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmpdir.cleanup()
+
+    def insert(self, query_date, songs):
+        self.exporter.insert_data_db(self.conn, artists_frame(query_date=query_date, name_song=songs))
+
+    def read_partition(self, query_date):
+        return pd.read_csv(os.path.join(self.tmpdir.name, "csv_files", f"artists_data_{query_date}.csv"))
+
+    def test_export_only_new_rows_by_query_date(self):
+        self.insert('2023-12-14', ['TNT', 'High Voltage'])
+        self.exporter.export_sql_to_csv(self.conn)
+        self.insert('2023-12-15', ['TNT'])
+        self.exporter.export_sql_to_csv(self.conn)
+        self.exporter.export_sql_to_csv(self.conn)
+        self.assertEqual(len(self.read_partition('2023-12-14')), 2)
+        self.assertEqual(list(self.read_partition('2023-12-15')['name_song']), ['TNT'])
+        self.assertEqual(list(self.read_partition('2023-12-15').columns), ['id'] + COLUMNS)
+
+    def test_append_to_existing_partition(self):
+        self.insert('2023-12-14', ['TNT'])
+        self.exporter.export_sql_to_csv(self.conn)
+        self.insert('2023-12-14', ['High Voltage'])
+        self.exporter.export_sql_to_csv(self.conn)
+        self.assertEqual(list(self.read_partition('2023-12-14')['name_song']), ['TNT', 'High Voltage'])
+
+
+class TestExportJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+        self.conn = self.database.connect_database()
+
+    def tearDown(self):
+        self.database.close_database()
+        self.tmpdir.cleanup()
+
+    def get_songs_by_artists(self, failing):
+        def get_songs_by_artists(artists_list, id_cache=None, failed=None):
+            names = [name for name in artists_list if name not in failing]
+            failed.update({name: 'Timeout' for name in artists_list if name in failing})
+            return artists_frame(
+                id_artist=names,
+                query_date=pd.Timestamp.now().strftime("%Y-%m-%d"),
+                artist_name=names,
+                name_song="SONG",
+                album_name="ALBUM"
+            )
+        return get_songs_by_artists
+
+    def test_record(self):
+        journal = ExportJournal(self.conn, '2023-12-15')
+        with self.conn:
+            journal.record(['AC/DC'], {'Fresno': 'Timeout'})
+            journal.record(['Fresno'], {})
+        self.assertEqual(journal.completed(), {'ac/dc', 'fresno'})
+        self.assertEqual(journal.failures(), {})
+        self.assertEqual(ExportJournal(self.conn, '2023-12-16').completed(), set())
+        attempts = self.conn.execute("SELECT attempts FROM export_journal WHERE search_name = 'fresno'").fetchone()
+        self.assertEqual(attempts, (2,))
+
+    @patch('src.data_exporter.DataExporter.export_sql_to_csv')
+    @patch('src.data_exporter.DataExporter.iter_artists_names')
+    def test_resume_fetch_only_remaining_artists(self, mock_iter_artists_names, mock_export_sql_to_csv):
+        source = MagicMock()
+        source.get_songs_by_artists.side_effect = self.get_songs_by_artists({'Fresno'})
+        mock_iter_artists_names.side_effect = lambda: iter(['AC/DC', 'Fresno', 'Slipknot'])
+        exporter = DataExporter(source=source, conn=self.database, chunk_size=2, resume=True)
+        self.assertEqual(exporter.export_data(), (2, 0, {'Fresno': 'Timeout'}))
+
+        source.get_songs_by_artists.side_effect = self.get_songs_by_artists(set())
+        source.get_songs_by_artists.reset_mock()
+        self.assertEqual(exporter.export_data(), (1, 0, {}))
+        source.get_songs_by_artists.assert_called_once()
+        self.assertEqual(source.get_songs_by_artists.call_args.args[0], ['Fresno'])
@@ -0,0 +1,524 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from src.data_provider import MIGRATIONS, ConnectToSQLite, DataProvider, QueryCache, RedisQueryCache, fold_artist_name
+from src.data_provider import RECENT_DATA_QUERY, RECENT_ARTIST_QUERY, RECENT_DATA_BY_ARTISTS_QUERY, ARTIST_TRENDS_QUERY
+from src.data_exporter import DataExporter
+from tests.helpers import artists_frame
+import os
+import subprocess
+import sys
+import tempfile
+import sqlite3
+import threading
+import time
+
+class TesteConnectToSQLite(unittest.TestCase):
+    def test_init(self):
+        conn = ConnectToSQLite()
+        self.assertEqual(conn.database_name, "artists_data.db")
+        self.assertEqual(conn.database_file, "sql_files")
+        
+    def test_check_path(self):
+        conn = ConnectToSQLite()
+        self.assertEqual(conn.check_path("sql_files"), os.path.join("src", "data_files", "sql_files"))
+        
+    @patch('src.data_provider.sqlite3.connect')
+    def test_create_database(self, mock_connect):
+        conn = ConnectToSQLite()
+        conn.create_database()
+        mock_connect.assert_called_once()
+        
+    @patch('src.data_provider.ConnectToSQLite.check_path')
+    @patch('src.data_provider.os.path.join')
+    @patch('src.data_provider.sqlite3.connect')
+    def teste_connect_database(self, mock_connect, mock_join, mock_check_path):
+        mock_check_path.return_value = 'TEST'
+        conn = ConnectToSQLite()
+        conn.connect_database()
+        mock_check_path.assert_called_once()
+        mock_join.assert_called_once()
+        mock_connect.assert_called_once()
+        
+
+    def test_connect_database_reuse_per_thread(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ConnectToSQLite(base_path=tmpdir) as database:
+                conn = database.connect_database()
+                self.assertIs(database.connect_database(), conn)
+                other = []
+                thread = threading.Thread(target=lambda: other.append(database.connect_database()))
+                thread.start()
+                thread.join()
+                self.assertIsNot(other[0], conn)
+                self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+                self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+    def test_connect_database_reopen_closed_connection(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ConnectToSQLite(base_path=tmpdir) as database:
+                conn = database.connect_database()
+                conn.close()
+                self.assertEqual(database.connect_database().execute("SELECT 1").fetchone(), (1,))
+
+    def test_read_while_writing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ConnectToSQLite(base_path=tmpdir) as database:
+                writer = database.connect_database()
+                writer.execute("BEGIN IMMEDIATE")
+                writer.execute("INSERT INTO artist_ids VALUES ('ac/dc', 'ID', 0)")
+                result = []
+                thread = threading.Thread(target=lambda: result.append(
+                    database.connect_database().execute("SELECT COUNT(*) FROM artist_ids").fetchone()[0]
+                ))
+                thread.start()
+                thread.join()
+                writer.commit()
+                self.assertEqual(result, [0])
+
+    def test_migrate_database(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conn = ConnectToSQLite(base_path=tmpdir).connect_database()
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            self.assertGreater(version, 0)
+            conn.close()
+
+    def test_concurrent_migration(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ConnectToSQLite(base_path=tmpdir).create_database()
+            barrier = threading.Barrier(4)
+            results = []
+            def connect():
+                database = ConnectToSQLite(base_path=tmpdir)
+                barrier.wait()
+                try:
+                    results.append(database.connect_database().execute("PRAGMA user_version").fetchone()[0])
+                except sqlite3.Error as e:
+                    results.append(e)
+                database.close_database()
+            threads = [threading.Thread(target=connect) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results, [len(MIGRATIONS)] * 4)
+
+    def test_failed_migration_is_retried(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ConnectToSQLite(base_path=tmpdir) as database:
+                database.create_database()
+                conn = sqlite3.connect(database.database_path())
+                conn.execute("CREATE TABLE export_watermark (id INTEGER)")
+                conn.close()
+                for _ in range(2):
+                    with self.assertRaises(sqlite3.OperationalError):
+                        database.connect_database()
+                self.assertFalse(database.migrated)
+                self.assertEqual(database.connections, [])
+                conn = sqlite3.connect(database.database_path())
+                conn.execute("DROP TABLE export_watermark")
+                conn.close()
+                conn = database.connect_database()
+                self.assertFalse(conn.in_transaction)
+                self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], len(MIGRATIONS))
+
+    def test_migrate_to_normalized_schema(self):
+        rows = [
+            (1, 'ID', '2023-12-14', 'ACDC', 10, 80, 'TNT', 70, '1975', 'T.N.T.', 9),
+            (2, 'ID', '2023-12-14', 'ACDC', 10, 80, 'High Voltage', 60, '1975', 'T.N.T.', 9),
+            (3, 'ID', '2023-12-15', 'AC/DC', 20, 81, 'TNT', 71, '1975', 'T.N.T.', 9),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with ConnectToSQLite(base_path=tmpdir) as database:
+                database.create_database()
+                conn = sqlite3.connect(database.database_path())
+                with conn:
+                    conn.executemany(f"INSERT INTO artists_data VALUES ({', '.join('?' for _ in range(11))})", rows)
+                stored = conn.execute("SELECT * FROM artists_data ORDER BY id").fetchall()
+                conn.close()
+                conn = database.connect_database()
+                # Same ids and values; the artist keeps the name of its newest snapshot.
+                self.assertEqual(conn.execute("SELECT * FROM artists_data ORDER BY id").fetchall(),
+                                 [row[:3] + ('AC/DC',) + row[4:] + ('BR',) for row in stored])
+                counts = [conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                          for table in ("artists", "albums", "tracks", "artist_snapshots", "track_snapshots")]
+                self.assertEqual(counts, [1, 1, 2, 2, 3])
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM latest_snapshot").fetchone()[0], 1)
+
+
+class FakeRedis():
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value.encode("utf-8")
+
+
+class TestQueryCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = QueryCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.stats(), {"hits": 3, "misses": 1, "size": 2})
+
+    def test_ttl(self):
+        cache = QueryCache(ttl=60)
+        cache.set('a', 1)
+        with patch('src.data_provider.time.monotonic', return_value=time.monotonic() + 120):
+            self.assertIsNone(cache.get('a'))
+
+    def test_redis_cache(self):
+        cache = RedisQueryCache(client=FakeRedis())
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', {"AC/DC": [1, 2]})
+        self.assertEqual(cache.get('a'), {"AC/DC": [1, 2]})
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "errors": 0})
+
+    def test_redis_cache_errors_fall_through(self):
+        client = MagicMock()
+        client.get.side_effect = ConnectionError("Connection refused")
+        client.set.side_effect = ConnectionError("Connection refused")
+        cache = RedisQueryCache(client=client)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.stats(), {"hits": 0, "misses": 1, "errors": 2})
+
+
+class TestDataProvider(unittest.TestCase):
+    def test_import_without_export_dependencies(self):
+        code = "import sys, src.data_provider; print(sorted(m for m in ('pandas', 'requests', 'dotenv') if m in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_init(self):
+        provider = DataProvider()
+        self.assertIsInstance(provider.source, DataExporter)
+        self.assertIsInstance(provider.conn, ConnectToSQLite)
+        
+    @patch('src.data_provider.ConnectToSQLite.connect_database')
+    def test_getRecentDataByArtist(self, mock_connect_database):
+        mock_connect_database.cursor.execute.fatchone.return_value = 'TEST'
+        provider = DataProvider()
+        provider.getRecentDataByArtist('TESTE')
+        mock_connect_database.assert_called_once()
+    
+    @patch('src.data_provider.ConnectToSQLite.connect_database')
+    def getRecentTopTracksDataByArtist(self, mock_connect_database):
+        mock_connect_database.cursor.execute.fatchone.return_value = 'TEST'
+        provider = DataProvider()
+        provider.getRecentTopTracksDataByArtist('TEST')
+        mock_connect_database.assert_called_once()
+        
+    @patch('src.data_provider.ConnectToSQLite.connect_database')
+    def getRecentTopTracksDataByArtist_raise_exception(self, mock_connect_database):
+        mock_connect_database.cursor.execute.side_effect = Exception
+        with self.assertRaises(Exception):
+            provider = DataProvider()
+            provider.getRecentTopTracksDataByArtist('TEST')
+
+
+class TestDataProviderQueries(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+        conn = self.database.connect_database()
+        exporter = DataExporter()
+        for query_date, followers, songs in (('2023-12-14', 10, ['TNT', 'High Voltage']), ('2023-12-15', 20, ['TNT'])):
+            exporter.insert_data_db(conn, artists_frame(query_date=query_date, followers=followers, name_song=songs))
+        conn.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_query_plan_uses_indexes(self):
+        conn = self.database.connect_database()
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + RECENT_DATA_QUERY, ('ID',))]
+        conn.close()
+        self.assertFalse([step for step in plan if step.startswith("SCAN")], plan)
+        self.assertFalse([step for step in plan if "TEMP B-TREE" in step], plan)
+
+    def test_artist_query_plan_uses_indexes(self):
+        conn = self.database.connect_database()
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + RECENT_ARTIST_QUERY, ('ID',))]
+        conn.close()
+        self.assertFalse([step for step in plan if step.startswith("SCAN")], plan)
+        self.assertFalse([step for step in plan if "TEMP B-TREE" in step], plan)
+
+    def test_getRecentDataByArtist(self):
+        provider = DataProvider(conn=self.database)
+        self.assertEqual(provider.getRecentDataByArtist('AC/DC')['AC/DC']['followers'], 20)
+        self.assertEqual(provider.getRecentDataByArtist('ID')['ID']['query_date'], '2023-12-15')
+
+    def test_getRecentTopTracksDataByArtist_only_latest_snapshot(self):
+        provider = DataProvider(conn=self.database)
+        tracks = provider.getRecentTopTracksDataByArtist('AC/DC')['AC/DC']
+        self.assertEqual([track['name_song'] for track in tracks], ['TNT'])
+        self.assertEqual(tracks[0]['query_date'], '2023-12-15')
+
+    def test_latest_snapshot_per_market(self):
+        conn = self.database.connect_database()
+        DataExporter().insert_data_db(conn, artists_frame(
+            query_date="2023-12-16",
+            followers=30,
+            name_song=["Thunderstruck"],
+            release_date="1990",
+            album_name="The Razors Edge",
+            total_tracks=10,
+            market="US"
+        ))
+        conn.close()
+        provider = DataProvider(conn=self.database)
+        tracks = provider.getRecentTopTracksDataByArtist('AC/DC', market='BR')['AC/DC']
+        self.assertEqual([(track['name_song'], track['query_date']) for track in tracks], [('TNT', '2023-12-15')])
+        tracks = provider.getRecentTopTracksDataByArtist('AC/DC', market='US')['AC/DC']
+        self.assertEqual([track['name_song'] for track in tracks], ['Thunderstruck'])
+        self.assertEqual(provider.getRecentDataByArtist('AC/DC')['AC/DC']['followers'], 30)
+        self.assertEqual(next(provider.iterRecentDataByArtists(['AC/DC']))['AC/DC']['followers'], 30)
+
+    def test_getRecentDataByArtists(self):
+        provider = DataProvider(conn=self.database)
+        result = provider.getRecentDataByArtists(['ID', 'Nobody', 'AC/DC'])
+        self.assertEqual(list(result), ['ID', 'Nobody', 'AC/DC'])
+        self.assertEqual(result['AC/DC']['followers'], 20)
+        self.assertIsNone(result['Nobody'])
+
+    def test_iterRecentTopTracksDataByArtists(self):
+        provider = DataProvider(conn=self.database)
+        results = list(provider.iterRecentTopTracksDataByArtists(['Nobody', 'AC/DC']))
+        self.assertEqual(results[0], {'Nobody': None})
+        self.assertEqual([track['name_song'] for track in results[1]['AC/DC']], ['TNT'])
+
+    def test_batch_query_plan_scan_only_keys(self):
+        conn = self.database.connect_database()
+        list(DataProvider(conn=self.database).iterRecentRowsByArtists(['ID']))
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + RECENT_DATA_BY_ARTISTS_QUERY)]
+        self.assertEqual([step for step in plan if step.startswith("SCAN")], ["SCAN lookup_keys"])
+        self.assertFalse([step for step in plan if "TEMP B-TREE" in step], plan)
+
+    def assert_cache_invalidated_by_export(self, cache):
+        provider = DataProvider(conn=self.database, cache=cache)
+        provider.getRecentDataByArtist('AC/DC')
+        self.assertEqual(provider.getRecentDataByArtist('AC/DC')['AC/DC']['followers'], 20)
+        self.assertEqual(cache.stats()["hits"], 1)
+        conn = self.database.connect_database()
+        DataExporter().insert_data_db(conn, artists_frame(query_date="2023-12-16", followers=30))
+        self.assertEqual(provider.getRecentDataByArtist('AC/DC')['AC/DC']['followers'], 30)
+        self.assertEqual(cache.stats()["misses"], 2)
+        self.assertEqual(provider.metrics.report()["counters"], {"cache.hits": 1, "cache.misses": 2})
+        self.assertEqual(provider.metrics.report()["timers"]["query.getRecentDataByArtist"]["count"], 3)
+
+    def test_data_version_rechecked_after_interval(self):
+        provider = DataProvider(conn=self.database, cache=QueryCache())
+        provider.getRecentDataByArtist('AC/DC')
+        other = sqlite3.connect(self.database.database_path())
+        with other:
+            other.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+        other.close()
+        with patch.object(provider, 'data_version', wraps=provider.data_version) as mock_data_version:
+            provider.getRecentDataByArtist('AC/DC')
+            mock_data_version.assert_not_called()
+            self.assertEqual(provider.cache.stats()["hits"], 1)
+            with patch('src.data_provider.time.monotonic', return_value=time.monotonic() + 2):
+                provider.getRecentDataByArtist('AC/DC')
+            mock_data_version.assert_called_once()
+        self.assertEqual(provider.cache.stats()["misses"], 2)
+
+    def test_memory_cache_invalidated_by_export(self):
+        self.assert_cache_invalidated_by_export(QueryCache())
+
+    def test_redis_cache_invalidated_by_export(self):
+        self.assert_cache_invalidated_by_export(RedisQueryCache(client=FakeRedis()))
+
+    def test_redis_cache_down(self):
+        client = MagicMock()
+        client.get.side_effect = ConnectionError("Connection refused")
+        provider = DataProvider(conn=self.database, cache=RedisQueryCache(client=client))
+        self.assertEqual(provider.getRecentDataByArtist('AC/DC')['AC/DC']['followers'], 20)
+        self.assertEqual(provider.cache.stats()["errors"], 1)
+
+    def test_getRecentDataByArtist_not_found(self):
+        provider = DataProvider(conn=self.database)
+        with self.assertRaises(ValueError):
+            provider.getRecentDataByArtist("' OR '1'='1")
+
+
+class TestDataProviderTrends(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+        conn = self.database.connect_database()
+        exporter = DataExporter()
+        history = (
+            ('ACDC', 'AC/DC', '2023-12-14', 100, 80, {'TNT': 70, 'Thunderstruck': 60}),
+            ('ACDC', 'AC/DC', '2023-12-15', 110, 82, {'TNT': 60, 'Thunderstruck': 65}),
+            ('ACDC', 'AC/DC', '2023-12-16', 132, 84, {'TNT': 62, 'Thunderstruck': 68}),
+            ('FRESNO', 'Fresno', '2023-12-14', 120, 60, {'Quebre as Correntes': 50}),
+            ('FRESNO', 'Fresno', '2023-12-15', 120, 60, {'Quebre as Correntes': 50}),
+            ('FRESNO', 'Fresno', '2023-12-16', 125, 61, {'Quebre as Correntes': 51}),
+        )
+        for id_artist, artist_name, query_date, followers, popularity, songs in history:
+            exporter.insert_data_db(conn, artists_frame(
+                id_artist=id_artist,
+                query_date=query_date,
+                artist_name=artist_name,
+                followers=followers,
+                artist_popularity=popularity,
+                name_song=list(songs),
+                song_popularity=list(songs.values()),
+                album_name="ALBUM"
+            ))
+
+    def tearDown(self):
+        self.database.close_database()
+        self.tmpdir.cleanup()
+
+    def test_daily_stats_maintained_by_export(self):
+        conn = self.database.connect_database()
+        stats = conn.execute("""
+            SELECT followers, avg_song_popularity, num_tracks FROM artist_daily_stats
+            WHERE id_artist = 'ACDC' AND query_date = '2023-12-15'
+        """).fetchone()
+        self.assertEqual(stats, (110, 62.5, 2))
+
+    def test_getArtistTrends(self):
+        trends = DataProvider(conn=self.database).getArtistTrends('AC/DC', None, None, 2)['AC/DC']
+        self.assertEqual([day['followers_delta'] for day in trends], [None, 10, 22])
+        self.assertEqual([day['followers_growth'] for day in trends], [None, 0.1, 0.2])
+        self.assertEqual([day['followers_rolling_avg'] for day in trends], [100, 105, 121])
+        self.assertEqual([day['followers_rank'] for day in trends], [2, 2, 1])
+        self.assertEqual([day['rank_change'] for day in trends], [None, 0, 1])
+
+    def test_getArtistTrends_date_range_keeps_previous_day(self):
+        trends = DataProvider(conn=self.database).getArtistTrends('ACDC', '2023-12-16', '2023-12-16')['ACDC']
+        self.assertEqual(len(trends), 1)
+        self.assertEqual(trends[0]['followers_delta'], 22)
+        self.assertEqual(trends[0]['rank_change'], 1)
+        self.assertEqual(trends[0]['followers_rolling_avg'], 114)
+
+    def test_trends_with_gaps_in_history(self):
+        conn = self.database.connect_database()
+        for query_date, followers, popularity in (('2023-01-01', 50, 40), ('2023-03-01', 100, 60)):
+            DataExporter().insert_data_db(conn, artists_frame(
+                id_artist="GAP", artist_name="Gap", query_date=query_date, followers=followers, song_popularity=popularity
+            ))
+        provider = DataProvider(conn=self.database)
+        trends = provider.getArtistTrends('Gap', None, None, 2)['Gap']
+        self.assertEqual([day['days_elapsed'] for day in trends], [None, 59])
+        self.assertEqual([day['followers_growth'] for day in trends], [None, 1.0])
+        self.assertEqual([day['followers_rolling_avg'] for day in trends], [50, 100])
+        trends = provider.getTrackTrends('Gap', None, None, 2)['Gap']
+        self.assertEqual([(day['days_elapsed'], day['popularity_delta'], day['popularity_rolling_avg']) for day in trends],
+                         [(None, None, 40), (59, 20, 60)])
+
+    def test_getTrackTrends(self):
+        trends = DataProvider(conn=self.database).getTrackTrends('AC/DC', '2023-12-15')['AC/DC']
+        self.assertEqual(
+            [(day['query_date'], day['name_song'], day['popularity_rank'], day['rank_change']) for day in trends],
+            [('2023-12-15', 'Thunderstruck', 1, 1), ('2023-12-15', 'TNT', 2, -1),
+             ('2023-12-16', 'Thunderstruck', 1, 0), ('2023-12-16', 'TNT', 2, 0)]
+        )
+        self.assertEqual(trends[1]['popularity_delta'], -10)
+
+    def test_getTrackTrends_by_market(self):
+        conn = self.database.connect_database()
+        DataExporter().insert_data_db(conn, artists_frame(
+            id_artist="ACDC",
+            query_date="2023-12-16",
+            followers=132,
+            artist_popularity=84,
+            name_song=["TNT", "Thunderstruck"],
+            song_popularity=[75, 40],
+            album_name="ALBUM",
+            market="US"
+        ))
+        provider = DataProvider(conn=self.database)
+        trends = provider.getTrackTrends('AC/DC', '2023-12-16', market='US')['AC/DC']
+        self.assertEqual([(day['market'], day['name_song'], day['popularity_rank']) for day in trends],
+                         [('US', 'TNT', 1), ('US', 'Thunderstruck', 2)])
+        self.assertEqual(trends[0]['popularity_delta'], None)
+        trends = provider.getTrackTrends('AC/DC', '2023-12-16')['AC/DC']
+        self.assertEqual([(day['market'], day['popularity_rank']) for day in trends],
+                         [('BR', 1), ('BR', 2), ('US', 1), ('US', 2)])
+        tracks = provider.getRecentTopTracksDataByArtist('AC/DC', market='US')['AC/DC']
+        self.assertEqual([(track['name_song'], track['market']) for track in tracks], [('TNT', 'US'), ('Thunderstruck', 'US')])
+        self.assertEqual(len(provider.getRecentTopTracksDataByArtist('AC/DC')['AC/DC']), 4)
+        stats = conn.execute("""
+            SELECT num_tracks FROM artist_daily_stats WHERE id_artist = 'ACDC' AND query_date = '2023-12-16'
+        """).fetchone()
+        self.assertEqual(stats, (2,))
+
+    def test_trends_not_found(self):
+        with self.assertRaises(ValueError):
+            DataProvider(conn=self.database).getArtistTrends('Nobody')
+
+    def test_trends_query_plan_uses_indexes(self):
+        conn = self.database.connect_database()
+        params = {"id_artist": "ACDC", "start_date": "2023-12-15", "end_date": "2023-12-16", "preceding": 6}
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + ARTIST_TRENDS_QUERY, params)]
+        self.assertFalse([step for step in plan if step.startswith("SCAN artist_daily_stats")], plan)
+
+
+class TestDataProviderSearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.database = ConnectToSQLite(base_path=self.tmpdir.name)
+        self.insert([('GRUPO', 'Grupo Menos é Mais', 300), ('BMTH', 'Bring Me The Horizon', 200),
+                     ('BRING', 'Bring Me Back', 100), ('ACDC', 'AC/DC', 400)])
+
+    def tearDown(self):
+        self.database.close_database()
+        self.tmpdir.cleanup()
+
+    def insert(self, artists, query_date='2023-12-15'):
+        conn = self.database.connect_database()
+        DataExporter().insert_data_db(conn, artists_frame(
+            id_artist=[artist[0] for artist in artists],
+            query_date=query_date,
+            artist_name=[artist[1] for artist in artists],
+            followers=[artist[2] for artist in artists],
+            name_song="SONG",
+            album_name="ALBUM"
+        ))
+
+    def test_fold_artist_name(self):
+        self.assertEqual(fold_artist_name("  Grupo  Menos É MAIS "), "grupo menos e mais")
+
+    def test_lookups_ignore_case_and_accents(self):
+        provider = DataProvider(conn=self.database)
+        self.assertEqual(provider.getRecentDataByArtist('grupo menos e mais')['grupo menos e mais']['id_artist'], 'GRUPO')
+        self.assertEqual(provider.getRecentDataByArtists(['BRING ME THE HORIZON', 'Nobody']),
+                         {'BRING ME THE HORIZON': provider.getRecentDataByArtist('BMTH')['BMTH'], 'Nobody': None})
+        self.assertEqual(len(provider.getArtistTrends('ac/dc')['ac/dc']), 1)
+
+    def test_folded_lookup_query_plan_uses_indexes(self):
+        conn = self.database.connect_database()
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + RECENT_DATA_QUERY, ('grupo menos e mais',))]
+        self.assertIn("SEARCH artists USING INDEX artists_search_name (search_name=?)", plan)
+        self.assertFalse([step for step in plan if step.startswith("SCAN")], plan)
+
+    def test_searchArtists(self):
+        provider = DataProvider(conn=self.database)
+        suggestions = provider.searchArtists('bring me')['bring me']
+        self.assertEqual([(item['id_artist'], item['match']) for item in suggestions], [('BMTH', 'prefix'), ('BRING', 'prefix')])
+        suggestions = provider.searchArtists('Bring Me Back')['Bring Me Back']
+        self.assertEqual([(item['id_artist'], item['match']) for item in suggestions], [('BRING', 'exact')])
+        suggestions = provider.searchArtists('menos e mais')['menos e mais']
+        self.assertEqual([(item['artist_name'], item['match']) for item in suggestions], [('Grupo Menos é Mais', 'fuzzy')])
+        suggestions = provider.searchArtists('brign me the horizon', 1)['brign me the horizon']
+        self.assertEqual([item['id_artist'] for item in suggestions], ['BMTH'])
+        self.assertEqual(provider.searchArtists('zz')['zz'], [])
+
+    def test_search_index_follows_renames(self):
+        self.insert([('BMTH', 'Bring Me The Horizön', 210)], '2023-12-16')
+        provider = DataProvider(conn=self.database)
+        suggestions = provider.searchArtists('horizon')['horizon']
+        self.assertEqual([(item['artist_name'], item['followers']) for item in suggestions], [('Bring Me The Horizön', 210)])
@@ -0,0 +1,57 @@
+import unittest
+from src.metrics import Metrics, Histogram
+import json
+import os
+import tempfile
+import threading
+
+class TestHistogram(unittest.TestCase):
+    def test_report(self):
+        histogram = Histogram()
+        for milliseconds in [1] * 90 + [40] * 9 + [3000]:
+            histogram.observe(milliseconds / 1000)
+        report = histogram.report()
+        self.assertEqual(report["count"], 100)
+        self.assertEqual(report["p50_ms"], 1)
+        self.assertEqual(report["p95_ms"], 50)
+        self.assertEqual(report["p99_ms"], 50)
+        self.assertEqual(report["max_ms"], 3000)
+        self.assertEqual(report["buckets_ms"], {"le_1": 90, "le_50": 9, "le_5000": 1})
+
+    def test_percentile_capped_by_max(self):
+        histogram = Histogram()
+        histogram.observe(0.0031)
+        self.assertEqual(histogram.percentile(50), 3.1)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_increment_from_threads(self):
+        metrics = Metrics()
+        def work():
+            for _ in range(1000):
+                metrics.increment("http.requests")
+                metrics.increment("http.bytes", 10)
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.report()["counters"], {"http.bytes": 40000, "http.requests": 4000})
+
+    def test_timer(self):
+        metrics = Metrics()
+        with metrics.timer("db.insert"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.timer("db.insert"):
+                raise ValueError()
+        self.assertEqual(metrics.report()["timers"]["db.insert"]["count"], 2)
+
+    def test_write(self):
+        metrics = Metrics()
+        metrics.increment("rows.inserted", 5)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "metrics", "run.json")
+            metrics.write(path)
+            with open(path, "r", encoding="utf-8") as infile:
+                self.assertEqual(json.load(infile)["counters"], {"rows.inserted": 5})